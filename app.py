@@ -1,25 +1,167 @@
 import streamlit as st
+import hashlib
 import json
 import os
 from utils import (
     get_acroform_fields,
-    fill_acroform_pdf,
+    fill_acroform_pdf_report,
     extract_text_elements_unstructured,
     get_llm_mappings,
-    prepare_data_for_filling
+    get_llm_mappings_incremental
 )
+from mapping_plan import compile_mapping_plan, profile_keys
+from llm_backends import BACKEND_NAMES, DEFAULT_BACKEND
 import streamlit as st
 from utils import extract_form_fields
+import metrics
+
+TEMP_DIR = "temp_uploads"
+
+
+# --- Cached layers ---
+# Every widget interaction reruns this script. Parsing results are cached by file content
+# hash (st.cache_data, shared by all sessions); LLM mappings are memoized per session.
+# The leading underscore keeps the temp path out of the cache key. Empty or failed parses
+# (a transient OCR error looks the same) are raised as _NotCached so st.cache_data, which
+# never stores exceptions, lets the next analysis try again.
+class _NotCached(Exception):
+    def __init__(self, result):
+        super().__init__("empty result, not cached")
+        self.result = result
+
+
+def _call_cached(cached_fn, *args):
+    try:
+        return cached_fn(*args)
+    except _NotCached as e:
+        return e.result
+
+
+@st.cache_data(show_spinner=False)
+def _read_sample_profile(mtime):
+    with open("sample_profile.json", 'r') as f:
+        return json.dumps(json.load(f), indent=2)
+
+
+@st.cache_data(show_spinner=False)
+def parse_profile_json(profile_json_str):
+    return json.loads(profile_json_str)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_form_text_fields(pdf_hash, _pdf_path):
+    metrics.cache_miss("form_text_fields")
+    fields = extract_form_fields(_pdf_path)
+    if not fields:
+        raise _NotCached(fields)
+    return fields
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_acroform_fields(pdf_hash, _pdf_path):
+    metrics.cache_miss("acroform_fields")
+    fields = get_acroform_fields(_pdf_path)
+    if not fields:
+        raise _NotCached(fields)  # None is both "no AcroForm" and "could not read it"
+    return fields
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_text_elements(pdf_hash, _pdf_path, ocr_mode):
+    metrics.cache_miss("text_elements")
+    elements = extract_text_elements_unstructured(_pdf_path, ocr_mode=ocr_mode, doc_hash=pdf_hash)
+    if not elements:
+        raise _NotCached(elements)
+    return elements
+
+
+def cached_form_text_fields(pdf_hash, pdf_path):
+    return _call_cached(_cached_form_text_fields, pdf_hash, pdf_path)
+
+
+def cached_acroform_fields(pdf_hash, pdf_path):
+    return _call_cached(_cached_acroform_fields, pdf_hash, pdf_path)
+
+
+def cached_text_elements(pdf_hash, pdf_path, ocr_mode):
+    return _call_cached(_cached_text_elements, pdf_hash, pdf_path, ocr_mode)
+
+
+def clear_analysis_caches():
+    """Explicit invalidation: drops cached parses and this session's mappings.
+
+    The parse caches are shared, so this clears them for every session, not just this one;
+    other sessions simply re-parse their document on their next analysis.
+    """
+    for cached in (_cached_form_text_fields, _cached_acroform_fields, _cached_text_elements):
+        cached.clear()
+    st.session_state.mapping_memo = {}
+    st.session_state.mapping_bases = {}
+
+
+def save_upload(uploaded_file):
+    """Writes an upload to TEMP_DIR once per distinct file; returns ``(path, content_hash)``.
+
+    Reruns reuse the previous result via session state, so the buffer is neither re-hashed
+    nor re-written while the same upload stays in the widget.
+    """
+    upload_key = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+    saved = st.session_state.setdefault('saved_uploads', {})
+    if upload_key in saved:
+        metrics.cache_hit("upload")
+        return saved[upload_key]
+
+    metrics.cache_miss("upload")
+    data = uploaded_file.getvalue()
+    pdf_hash = hashlib.sha256(data).hexdigest()
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    path = os.path.join(TEMP_DIR, f"{pdf_hash[:16]}_{os.path.basename(uploaded_file.name)}")
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(data)
+    saved[upload_key] = (path, pdf_hash)
+    return saved[upload_key]
+
+
+def get_llm_mappings_memoized(labels, profile_keys, form_type_hint="", backend=None):
+    """Per-session memo around get_llm_mappings; failed calls are not memoized.
+
+    When only the profile keys changed since the last mapping of the same labels, the
+    previous mapping is updated incrementally instead of re-mapping every label.
+    """
+    memo_key = hashlib.sha256(json.dumps([labels, profile_keys, form_type_hint, backend]).encode("utf-8")).hexdigest()
+    memo = st.session_state.setdefault('mapping_memo', {})
+    if memo_key in memo:
+        metrics.cache_hit("llm_mappings")
+        return memo[memo_key]
+    metrics.cache_miss("llm_mappings")
+
+    # Last successful mapping of these labels by this backend, whatever profile keys it was made with
+    base_key = hashlib.sha256(json.dumps([labels, form_type_hint, backend]).encode("utf-8")).hexdigest()
+    bases = st.session_state.setdefault('mapping_bases', {})
+    if base_key in bases:
+        previous_keys, previous_mappings = bases[base_key]
+        # Same labels as the previous call (they are part of base_key), so pass them as previous_texts
+        mappings = get_llm_mappings_incremental(labels, profile_keys, previous_mappings, previous_keys,
+                                                form_type_hint=form_type_hint, backend=backend,
+                                                previous_texts=labels)
+    else:
+        mappings = get_llm_mappings(labels, profile_keys, form_type_hint=form_type_hint, backend=backend)
+    if isinstance(mappings, dict) and "error" not in mappings:
+        memo[memo_key] = mappings
+        if "info" not in mappings:
+            bases[base_key] = (list(profile_keys), mappings)
+    return mappings
+
 
 uploaded_file = st.file_uploader("Upload a fillable PDF", type="pdf")
 
 if uploaded_file:
-    with open("temp.pdf", "wb") as f:
-        f.write(uploaded_file.read())
+    quick_pdf_path, quick_pdf_hash = save_upload(uploaded_file)
 
     st.success("Fillable PDF (AcroForm) detected")
 
-    fields = extract_form_fields("temp.pdf")
+    fields = cached_form_text_fields(quick_pdf_hash, quick_pdf_path)
 
     if fields:
         st.subheader("Extracted Form Fields")
@@ -46,13 +188,19 @@ if 'filled_pdf_path' not in st.session_state:
     st.session_state.filled_pdf_path = None
 if 'processing_mode' not in st.session_state: # "acroform" or "unstructured"
     st.session_state.processing_mode = None
+if 'last_trace_json' not in st.session_state: # JSON trace of the last analyze/fill request
+    st.session_state.last_trace_json = None
+if 'pdf_hash' not in st.session_state: # SHA-256 of the uploaded PDF; key for the cached layers
+    st.session_state.pdf_hash = None
+if 'filled_pdf_bytes' not in st.session_state: # Filled PDF kept in memory for the download button
+    st.session_state.filled_pdf_bytes = None
 
 
 # --- Helper to load sample profile ---
 def load_sample_profile():
     try:
-        with open("sample_profile.json", 'r') as f:
-            return json.dumps(json.load(f), indent=2)
+        # The file's mtime is part of the cache key, so edits to it are picked up
+        return _read_sample_profile(os.path.getmtime("sample_profile.json"))
     except FileNotFoundError:
         return "{}"
 
@@ -80,23 +228,46 @@ with st.sidebar:
         height=250
     )
     try:
-        st.session_state.user_profile = json.loads(user_profile_json_str)
+        st.session_state.user_profile = parse_profile_json(user_profile_json_str)
         st.success("Profile JSON loaded successfully!")
     except json.JSONDecodeError:
         st.error("Invalid JSON format in profile data.")
         st.session_state.user_profile = {}
 
+    field_transforms_str = st.text_area(
+        "Value transforms (optional JSON):",
+        value=st.session_state.get('field_transforms_str', ""),
+        placeholder='{"Date of Birth": "date:%d/%m/%Y", "Phone": "phone:digits"}',
+        help="PDF field -> transform applied to its profile value: date:<strftime format>, "
+             "phone, phone:digits, upper, lower, title or strip.",
+        height=100
+    )
+    st.session_state.field_transforms_str = field_transforms_str
+    try:
+        field_transforms = json.loads(field_transforms_str) if field_transforms_str.strip() else {}
+        if not isinstance(field_transforms, dict):
+            raise ValueError("expected a JSON object")
+    except ValueError as e:  # json.JSONDecodeError is a ValueError
+        st.error(f"Invalid value transforms ({e}); ignoring them.")
+        field_transforms = {}
+
     # 2. PDF Upload
     st.subheader("2. Upload PDF Form")
     uploaded_file = st.file_uploader("Choose a PDF file", type="pdf")
 
     if uploaded_file:
         # Save uploaded file temporarily to pass its path to processing functions
-        temp_dir = "temp_uploads"
-        os.makedirs(temp_dir, exist_ok=True)
-        st.session_state.pdf_path = os.path.join(temp_dir, uploaded_file.name)
-        with open(st.session_state.pdf_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        pdf_path, pdf_hash = save_upload(uploaded_file)
+        if pdf_hash != st.session_state.pdf_hash:
+            # A different document: results for the previous one no longer apply
+            st.session_state.acroform_fields = None
+            st.session_state.extracted_texts = None
+            st.session_state.llm_mappings = None
+            st.session_state.filled_pdf_path = None
+            st.session_state.filled_pdf_bytes = None
+            st.session_state.processing_mode = None
+        st.session_state.pdf_path = pdf_path
+        st.session_state.pdf_hash = pdf_hash
         st.success(f"Uploaded '{uploaded_file.name}'")
 
     # 3. Form Type Hint (Bonus)
@@ -111,17 +282,38 @@ with st.sidebar:
     elif form_type_hint != "Generic":
         final_form_hint = f"This is a {form_type_hint}."
 
+    label_only_ocr = st.checkbox(
+        "Label-only OCR for scanned forms (faster)",
+        help="OCR only the text next to detected lines, boxes and checkboxes instead of whole pages."
+    )
+
+    llm_backend = st.selectbox(
+        "LLM backend",
+        BACKEND_NAMES,
+        index=BACKEND_NAMES.index(DEFAULT_BACKEND) if DEFAULT_BACKEND in BACKEND_NAMES else 0,
+        help="'auto' uses Gemini and falls back to the local OpenAI-compatible endpoint when Gemini is slow or down."
+    )
+
+    if st.button(
+        "🧹 Clear cached analysis",
+        help="Re-parse the PDF and re-query the LLM on the next analysis. Parsed documents are "
+             "cached for all sessions, so this clears them for everyone."
+    ):
+        clear_analysis_caches()
+
 
     # 4. Process Button
     st.subheader("4. Process Form")
     if st.button("🚀 Analyze and Map Fields", disabled=(not uploaded_file or not st.session_state.user_profile)):
         st.session_state.llm_mappings = None # Reset previous mappings
         st.session_state.filled_pdf_path = None # Reset previous filled PDF
+        st.session_state.filled_pdf_bytes = None
 
-        with st.spinner("Processing PDF and mapping fields... This may take a moment."):
+        pdf_name = os.path.basename(st.session_state.pdf_path)
+        with st.spinner("Processing PDF and mapping fields... This may take a moment."), metrics.trace("analyze", pdf=pdf_name) as request_trace:
             # --- PDF Processing Logic ---
             # Try AcroForm extraction first
-            st.session_state.acroform_fields = get_acroform_fields(st.session_state.pdf_path)
+            st.session_state.acroform_fields = cached_acroform_fields(st.session_state.pdf_hash, st.session_state.pdf_path)
 
             if st.session_state.acroform_fields:
                 st.session_state.processing_mode = "acroform"
@@ -129,28 +321,35 @@ with st.sidebar:
 
                 if st.session_state.acroform_fields:
                     st.subheader("📝 Extracted AcroForm Fields from PDF")
-                    st.json(st.session_state.acroform_fields)
+                    st.json({name: field.to_dict() for name, field in st.session_state.acroform_fields.items()})
 
                 pdf_field_names = list(st.session_state.acroform_fields.keys())
-                st.session_state.llm_mappings = get_llm_mappings(
+                st.session_state.llm_mappings = get_llm_mappings_memoized(
                     pdf_field_names,
-                    list(st.session_state.user_profile.keys()),
-                    form_type_hint=final_form_hint
+                    profile_keys(st.session_state.user_profile),
+                    form_type_hint=final_form_hint,
+                    backend=llm_backend
                 )
             else:
                 st.session_state.processing_mode = "unstructured"
                 st.info("Not a fillable AcroForm or no fields found. Attempting text extraction for mapping...")
-                st.session_state.extracted_texts = extract_text_elements_unstructured(st.session_state.pdf_path)
+                st.session_state.extracted_texts = cached_text_elements(
+                    st.session_state.pdf_hash,
+                    st.session_state.pdf_path,
+                    "roi" if label_only_ocr else "full"
+                )
                 if st.session_state.extracted_texts:
                     # Get just the text for the LLM
                     text_labels_for_llm = [item['text'] for item in st.session_state.extracted_texts]
-                    st.session_state.llm_mappings = get_llm_mappings(
+                    st.session_state.llm_mappings = get_llm_mappings_memoized(
                         text_labels_for_llm,
-                        list(st.session_state.user_profile.keys()),
-                        form_type_hint=final_form_hint
+                        profile_keys(st.session_state.user_profile),
+                        form_type_hint=final_form_hint,
+                        backend=llm_backend
                     )
                 else:
                     st.error("Could not extract any text elements from the PDF.")
+        st.session_state.last_trace_json = metrics.trace_to_json(request_trace, indent=2)
 
 # --- Main Area for Displaying Results ---
 if st.session_state.get('llm_mappings'):
@@ -166,23 +365,16 @@ if st.session_state.get('llm_mappings'):
         col2.subheader("➡️ Mapped Profile Key")
         col3.subheader("👤 Profile Value")
 
-        data_to_fill_preview = prepare_data_for_filling(st.session_state.llm_mappings, st.session_state.user_profile)
+        # Resolve the mappings once; the preview, the fill and the text export all reuse this plan
+        mapping_plan = compile_mapping_plan(st.session_state.llm_mappings, transforms=field_transforms)
+
+        for pdf_field, profile_key, value_to_show in mapping_plan.rows(st.session_state.user_profile): # Only mapped fields
+            col1.text(pdf_field)
+            col2.text(profile_key)
+            col3.text(value_to_show)
 
         for pdf_field, profile_key in st.session_state.llm_mappings.items():
-            if profile_key != "NOMATCH" and profile_key is not None : # Show only mapped fields
-                col1.text(pdf_field)
-                col2.text(profile_key)
-                
-                # Get the actual value that would be filled
-                value_to_show = ""
-                if isinstance(profile_key, str) and ',' in profile_key:
-                    keys = [k.strip() for k in profile_key.split(',')]
-                    value_to_show = " ".join([str(st.session_state.user_profile.get(k, '')) for k in keys]).strip()
-                else:
-                    value_to_show = st.session_state.user_profile.get(profile_key, "KEY_NOT_FOUND")
-                
-                col3.text(value_to_show)
-            elif profile_key == "NOMATCH": # Optionally show NOMATCH fields
+            if profile_key == "NOMATCH": # Optionally show NOMATCH fields
                 with st.expander(f"Unmatched: {pdf_field}"):
                     st.caption("LLM indicated NOMATCH for this field.")
 
@@ -190,35 +382,49 @@ if st.session_state.get('llm_mappings'):
         # --- Fill PDF Button (only for AcroForms for now) ---
         if st.session_state.processing_mode == "acroform" and st.session_state.acroform_fields:
             st.header("✍️ Fill PDF")
+            fill_col1, fill_col2 = st.columns(2)
+            with fill_col1:
+                output_compression = st.selectbox(
+                    "Output compression",
+                    ["fast", "max", "none"],
+                    help="'fast' drops unused objects and deflates streams; 'max' also merges duplicate objects (slower)."
+                )
+            with fill_col2:
+                flatten_output = st.checkbox("Flatten filled fields", help="Burn values into the pages; the output is no longer editable.")
             if st.button("Generate Filled PDF"):
-                with st.spinner("Filling PDF..."):
+                pdf_name = os.path.basename(st.session_state.pdf_path)
+                with st.spinner("Filling PDF..."), metrics.trace("fill", pdf=pdf_name) as request_trace:
                     output_pdf_name = f"filled_{os.path.basename(st.session_state.pdf_path)}"
-                    output_pdf_path_temp = os.path.join("temp_uploads", output_pdf_name)
+                    output_pdf_path_temp = os.path.join(TEMP_DIR, output_pdf_name)
                     
-                    data_for_filling = {}
                     # AcroForm fields are the keys from get_acroform_fields
                     # LLM mappings use these keys if it was an AcroForm
-                    for acro_field_name in st.session_state.acroform_fields.keys():
-                        # The LLM might have mapped this acro_field_name directly
-                        # or it might have mapped a more descriptive label that *is* this acro_field_name.
-                        # For simplicity here, we assume LLM output keys match acro_field_name if it's an Acroform.
-                        # A more robust solution would be to map LLM output keys back to original acro_field_name if they differ.
-                        mapped_profile_key = st.session_state.llm_mappings.get(acro_field_name)
-                        
-                        if mapped_profile_key and mapped_profile_key != "NOMATCH":
-                            if isinstance(mapped_profile_key, str) and ',' in mapped_profile_key:
-                                keys = [k.strip() for k in mapped_profile_key.split(',')]
-                                value = " ".join([str(st.session_state.user_profile.get(k, '')) for k in keys]).strip()
-                            else:
-                                value = st.session_state.user_profile.get(mapped_profile_key, '')
-                            data_for_filling[acro_field_name] = value
+                    # For simplicity here, we assume LLM output keys match acro_field_name if it's an Acroform.
+                    # A more robust solution would be to map LLM output keys back to original acro_field_name if they differ.
+                    data_for_filling = mapping_plan.apply(
+                        st.session_state.user_profile,
+                        fields=st.session_state.acroform_fields
+                    )
                     
-                    success = fill_acroform_pdf(st.session_state.pdf_path, output_pdf_path_temp, data_for_filling)
-                    if success:
+                    fill_report = fill_acroform_pdf_report(
+                        st.session_state.pdf_path,
+                        output_pdf_path_temp,
+                        data_for_filling,
+                        compression=output_compression,
+                        flatten=flatten_output,
+                        workers=1  # One process per request: many sessions share this server
+                    )
+                    if "error" not in fill_report:
                         st.session_state.filled_pdf_path = output_pdf_path_temp
+                        with open(output_pdf_path_temp, "rb") as f:
+                            st.session_state.filled_pdf_bytes = f.read()
                         st.success(f"PDF filled successfully! Path: {st.session_state.filled_pdf_path}")
+                        st.caption(f"{fill_report['fields_filled']} fields filled, "
+                                   f"{fill_report['output_bytes'] / 1024:.0f} KB (template {fill_report['input_bytes'] / 1024:.0f} KB), "
+                                   f"saved in {fill_report['save_s']:.2f}s.")
                     else:
-                        st.error("Failed to fill PDF.")
+                        st.error(f"Failed to fill PDF: {fill_report['error']}")
+                st.session_state.last_trace_json = metrics.trace_to_json(request_trace, indent=2)
 
         elif st.session_state.processing_mode == "unstructured":
             st.info("""
@@ -235,15 +441,8 @@ if st.session_state.get('llm_mappings'):
             # For demonstration, one could generate a text file with the mappings
             if st.button("Download Mappings as Text"):
                 text_content = "LLM Form Filler Mappings:\n\n"
-                for pdf_field, profile_key in st.session_state.llm_mappings.items():
-                    if profile_key != "NOMATCH" and profile_key is not None:
-                        value_to_show = ""
-                        if isinstance(profile_key, str) and ',' in profile_key:
-                            keys = [k.strip() for k in profile_key.split(',')]
-                            value_to_show = " ".join([str(st.session_state.user_profile.get(k, '')) for k in keys]).strip()
-                        else:
-                            value_to_show = st.session_state.user_profile.get(profile_key, "KEY_NOT_FOUND")
-                        text_content += f'"{pdf_field}": "{value_to_show}" (from profile key: {profile_key})\n'
+                for pdf_field, profile_key, value_to_show in mapping_plan.rows(st.session_state.user_profile):
+                    text_content += f'"{pdf_field}": "{value_to_show}" (from profile key: {profile_key})\n'
                 
                 st.download_button(
                     label="Download Mappings (.txt)",
@@ -253,14 +452,14 @@ if st.session_state.get('llm_mappings'):
                 )
 
 
-    if st.session_state.get('filled_pdf_path'):
-        with open(st.session_state.filled_pdf_path, "rb") as f:
-            st.download_button(
-                label="Download Filled PDF",
-                data=f,
-                file_name=os.path.basename(st.session_state.filled_pdf_path),
-                mime="application/pdf"
-            )
+    if st.session_state.get('filled_pdf_bytes'):
+        # Served from memory, so clicking download doesn't re-read the file
+        st.download_button(
+            label="Download Filled PDF",
+            data=st.session_state.filled_pdf_bytes,
+            file_name=os.path.basename(st.session_state.filled_pdf_path),
+            mime="application/pdf"
+        )
 
 elif st.session_state.get('pdf_path') and not st.session_state.get('llm_mappings'):
     if st.session_state.processing_mode == "acroform" and not st.session_state.acroform_fields:
@@ -268,6 +467,22 @@ elif st.session_state.get('pdf_path') and not st.session_state.get('llm_mappings
     elif st.session_state.processing_mode == "unstructured" and not st.session_state.extracted_texts:
         st.error("Failed to extract text elements from the PDF for mapping. The PDF might be empty, image-only without OCR, or corrupted.")
 
+# --- Pipeline instrumentation ---
+if st.session_state.get('last_trace_json'):
+    with st.expander("⏱️ Pipeline timings (last request)"):
+        st.code(st.session_state.last_trace_json, language="json")
+        st.download_button(
+            label="Download trace (.json)",
+            data=st.session_state.last_trace_json,
+            file_name="trace.json",
+            mime="application/json"
+        )
+        st.download_button(
+            label="Download metrics (Prometheus text)",
+            data=metrics.prometheus_text(),
+            file_name="metrics.prom",
+            mime="text/plain"
+        )
 
 # --- Cleanup old temp files (optional, for a long-running app) ---
 # You might add a more robust cleanup mechanism if this were a deployed service.
@@ -0,0 +1,377 @@
+"""Sharded batch filling for large manifests (tens of thousands of PDFs).
+
+The manifest is split into a fixed number of shards (line number modulo shard count).
+Worker processes claim shards through files in a shared work directory, so the same
+command can run on one machine or on several nodes that mount the same directory:
+
+    python batch.py manifest.jsonl --work-dir /shared/run1 --shards 256 --workers 8
+
+Manifest lines are JSON objects ``{"pdf": ..., "profile": <path or object>,
+"output": <optional path>, "hint": <optional>, "backend": <optional LLM backend name>,
+"transforms": <optional {pdf_field: spec}, see mapping_plan>}``; a bare line is treated
+as a PDF path filled with ``--profile``.
+
+Every finished item is appended (and fsynced) to ``shard-NNNNN.done.jsonl`` before the
+next one starts, which gives at-least-once completion: a crashed shard is picked up
+again - by any node - once its claim goes stale, and resumes after the last checkpoint.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_STALE_CLAIM_S = 300
+DONE_STATUSES = ("ok", "skipped")
+
+# Per-process caches: the same template/profile shows up many times in a batch.
+_profile_cache = {}
+_mapping_cache = {}
+_plan_cache = {}
+
+
+def _shard_paths(work_dir, shard_index):
+    base = os.path.join(work_dir, f"shard-{shard_index:05d}")
+    return {
+        "claim": base + ".claim",
+        "checkpoint": base + ".done.jsonl",
+        "complete": base + ".complete",
+        "metrics": base + ".metrics.prom",
+    }
+
+
+def _worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def iter_manifest(manifest_path, num_shards=1, shard_index=0, default_profile=None):
+    """Yields ``(line_no, item)`` for the manifest lines that belong to one shard."""
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            if line_no % num_shards != shard_index:
+                continue
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+            else:
+                item = {"pdf": line}
+            if "profile" not in item:
+                item["profile"] = default_profile
+            item.setdefault("id", f"{line_no}:{item['pdf']}")
+            yield line_no, item
+
+
+def load_checkpoint(checkpoint_path):
+    """Returns the ids of items already completed in a shard checkpoint."""
+    done = set()
+    if not os.path.exists(checkpoint_path):
+        return done
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Torn last line from a crash; that item is simply redone
+            if record.get("status") in DONE_STATUSES:
+                done.add(record["id"])
+    return done
+
+
+def _repair_checkpoint(checkpoint_path):
+    """Drops a torn last line left by a crash, so the next record starts on its own line."""
+    try:
+        with open(checkpoint_path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+    except FileNotFoundError:
+        pass
+
+
+def _append_checkpoint(f, record):
+    f.write(json.dumps(record) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _create_claim(claim_path):
+    """O_EXCL-creates the claim file; returns its token when this process now owns it."""
+    token = f"{_worker_id()}:{uuid.uuid4().hex}"
+    try:
+        fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token if owns_claim(claim_path, token) else None
+
+
+def owns_claim(claim_path, token):
+    try:
+        with open(claim_path, "r") as f:
+            return f.read() == token
+    except FileNotFoundError:
+        return False
+
+
+def try_claim_shard(work_dir, shard_index, stale_after_s=DEFAULT_STALE_CLAIM_S):
+    """Claims a shard for this process and returns the claim token (``None`` if not claimed).
+
+    A stale claim (no heartbeat for ``stale_after_s``) is taken over by renaming it to a
+    unique name first; only one contender's rename of that file can succeed.
+    """
+    paths = _shard_paths(work_dir, shard_index)
+    if os.path.exists(paths["complete"]):
+        return None
+    token = _create_claim(paths["claim"])
+    if token:
+        return token
+
+    try:
+        stale = os.stat(paths["claim"])
+    except FileNotFoundError:
+        return _create_claim(paths["claim"])
+    age = time.time() - stale.st_mtime
+    if age < stale_after_s:
+        return None
+
+    retired = f"{paths['claim']}.stale-{uuid.uuid4().hex}"
+    try:
+        os.rename(paths["claim"], retired)
+    except FileNotFoundError:
+        return None  # Another worker is taking over the same claim
+    retired_stat = os.stat(retired)
+    if (retired_stat.st_ino, retired_stat.st_mtime) != (stale.st_ino, stale.st_mtime):
+        # The claim changed between stat and rename: it is someone's fresh claim, put it back.
+        try:
+            os.link(retired, paths["claim"])
+        except FileExistsError:
+            pass
+        os.remove(retired)
+        return None
+    os.remove(retired)
+
+    logger.warning(f"Shard {shard_index} claim is stale ({age:.0f}s without heartbeat); taking it over.")
+    return _create_claim(paths["claim"])
+
+
+class _Heartbeat(threading.Thread):
+    """Touches the claim every ``interval_s`` while this worker still owns it.
+
+    Runs on its own thread so a single slow item cannot let the claim go stale. ``lost``
+    is set once the claim file no longer carries this worker's token.
+    """
+
+    def __init__(self, claim_path, token, interval_s):
+        super().__init__(daemon=True)
+        self.claim_path = claim_path
+        self.token = token
+        self.interval_s = interval_s
+        self.lost = threading.Event()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_s):
+            try:
+                if not owns_claim(self.claim_path, self.token):
+                    raise FileNotFoundError(self.claim_path)
+                os.utime(self.claim_path)
+            except FileNotFoundError:
+                self.lost.set()
+                return
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _load_profile(profile):
+    if isinstance(profile, dict):
+        return profile
+    if profile not in _profile_cache:
+        with open(profile, "r", encoding="utf-8") as f:
+            _profile_cache[profile] = json.load(f)
+    return _profile_cache[profile]
+
+
+def _default_output_path(out_dir, line_no, pdf_path):
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(out_dir, f"filled_{stem}_{line_no}.pdf")
+
+
+def process_item(line_no, item, out_dir, form_type_hint=""):
+    """Runs get_acroform_fields -> get_llm_mappings -> fill_acroform_pdf for one manifest item."""
+    from utils import fill_acroform_pdf, get_acroform_fields, get_llm_mappings
+    from mapping_plan import compile_mapping_plan, profile_keys
+
+    pdf_path = item["pdf"]
+    fields = get_acroform_fields(pdf_path)
+    if not fields:
+        return {"status": "skipped", "reason": "no AcroForm fields"}
+
+    profile = _load_profile(item["profile"])
+    hint = item.get("hint", form_type_hint)
+    backend = item.get("backend")
+    transforms = item.get("transforms") or {}
+    keys = profile_keys(profile)
+
+    # Identical templates with identically-shaped profiles reuse one LLM mapping per process.
+    cache_key = hashlib.sha1(json.dumps([sorted(fields), sorted(keys), hint, backend]).encode("utf-8")).hexdigest()
+    mappings = _mapping_cache.get(cache_key)
+    if mappings is None:
+        mappings = get_llm_mappings(list(fields.keys()), keys, form_type_hint=hint, backend=backend)
+        if not isinstance(mappings, dict) or "error" in mappings:
+            return {"status": "error", "reason": f"mapping failed: {mappings}"}
+        _mapping_cache[cache_key] = mappings
+    plan_key = (cache_key, json.dumps(transforms, sort_keys=True))
+    plan = _plan_cache.get(plan_key)
+    if plan is None:
+        plan = _plan_cache[plan_key] = compile_mapping_plan(mappings, transforms=transforms)
+
+    output_path = item.get("output") or _default_output_path(out_dir, line_no, pdf_path)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_output = f"{output_path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.part"  # Unique per worker
+    if not fill_acroform_pdf(pdf_path, tmp_output, plan.apply(profile, fields=fields)):
+        return {"status": "error", "reason": "fill failed"}
+    os.replace(tmp_output, output_path)  # Only complete files ever appear under the final name
+    return {"status": "ok", "output": output_path}
+
+
+def run_shard(manifest_path, work_dir, out_dir, num_shards, shard_index,
+              default_profile=None, form_type_hint="", stale_after_s=DEFAULT_STALE_CLAIM_S):
+    """Claims and processes one shard, resuming from its checkpoint. Returns a summary dict."""
+    import metrics
+
+    summary = {"shard": shard_index, "claimed": False, "lost_claim": False,
+               "ok": 0, "skipped": 0, "error": 0, "resumed": 0}
+    token = try_claim_shard(work_dir, shard_index, stale_after_s)
+    if not token:
+        return summary
+    summary["claimed"] = True
+    # Pool workers run many shards; each shard's .metrics.prom should only hold its own numbers.
+    metrics.reset()
+
+    paths = _shard_paths(work_dir, shard_index)
+    heartbeat = _Heartbeat(paths["claim"], token, interval_s=max(1.0, stale_after_s / 4))
+    heartbeat.start()
+    try:
+        done = load_checkpoint(paths["checkpoint"])
+        summary["resumed"] = len(done)
+        if done:
+            logger.info(f"Shard {shard_index}: resuming, {len(done)} items already completed.")
+
+        _repair_checkpoint(paths["checkpoint"])
+        with open(paths["checkpoint"], "a", encoding="utf-8") as checkpoint:
+            for line_no, item in iter_manifest(manifest_path, num_shards, shard_index, default_profile):
+                if item["id"] in done:
+                    continue
+                if heartbeat.lost.is_set():
+                    break
+                start = time.perf_counter()
+                try:
+                    with metrics.trace("batch_item", shard=shard_index, line=line_no):
+                        result = process_item(line_no, item, out_dir, form_type_hint)
+                except Exception as e:
+                    logger.error(f"Shard {shard_index}: item {item['id']} failed: {e}", exc_info=True)
+                    result = {"status": "error", "reason": str(e)}
+                if heartbeat.lost.is_set() or not owns_claim(paths["claim"], token):
+                    break  # Another worker owns the shard now; its checkpoint is not ours to write
+                result.update(id=item["id"], seconds=round(time.perf_counter() - start, 3))
+                _append_checkpoint(checkpoint, result)
+                summary[result["status"]] += 1
+    finally:
+        heartbeat.stop()
+
+    if heartbeat.lost.is_set() or not owns_claim(paths["claim"], token):
+        summary["lost_claim"] = True
+        logger.warning(f"Shard {shard_index}: claim was taken over by another worker; stopping.")
+        return summary
+
+    with open(paths["metrics"], "w", encoding="utf-8") as f:
+        f.write(metrics.prometheus_text())
+    if summary["error"] == 0:
+        open(paths["complete"], "w").close()
+    if owns_claim(paths["claim"], token):
+        os.remove(paths["claim"])
+    logger.info(f"Shard {shard_index} finished: {summary}")
+    return summary
+
+
+def _init_worker():
+    # One OCR/BLAS thread per process; parallelism comes from the process count.
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def run_batch(manifest_path, work_dir, out_dir=None, num_shards=64, workers=None,
+              default_profile=None, form_type_hint="", stale_after_s=DEFAULT_STALE_CLAIM_S, wait=False):
+    """Processes every shard of ``manifest_path`` with a pool of worker processes.
+
+    With ``wait=True`` the call keeps polling until all shards (including those claimed by
+    other nodes) are complete, taking over any whose claim goes stale.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    out_dir = out_dir or os.path.join(work_dir, "output")
+    workers = workers or os.cpu_count() or 1
+    totals = {"ok": 0, "skipped": 0, "error": 0, "shards_run": 0}
+    attempted = set()  # Shards this call already ran; items that failed there wait for the next run
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        while True:
+            pending = [i for i in range(num_shards)
+                       if i not in attempted and not os.path.exists(_shard_paths(work_dir, i)["complete"])]
+            if not pending:
+                break
+            futures = [
+                pool.submit(run_shard, manifest_path, work_dir, out_dir, num_shards, i,
+                            default_profile, form_type_hint, stale_after_s)
+                for i in pending
+            ]
+            for future in as_completed(futures):
+                summary = future.result()
+                if summary["claimed"]:
+                    attempted.add(summary["shard"])
+                    totals["shards_run"] += 1
+                    for status in ("ok", "skipped", "error"):
+                        totals[status] += summary[status]
+            if not wait:
+                break
+            time.sleep(min(30, stale_after_s / 4))
+
+    remaining = [i for i in range(num_shards) if not os.path.exists(_shard_paths(work_dir, i)["complete"])]
+    totals["shards_incomplete"] = len(remaining)
+    logger.info(f"Batch finished: {totals}")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a manifest of PDFs with sharded worker processes.")
+    parser.add_argument("manifest", help="JSONL manifest (or one PDF path per line)")
+    parser.add_argument("--work-dir", required=True, help="Shared directory for claims and checkpoints")
+    parser.add_argument("--out-dir", help="Where filled PDFs go (default: <work-dir>/output)")
+    parser.add_argument("--shards", type=int, default=64, help="Total shard count; must match across nodes")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes on this node (default: CPU count)")
+    parser.add_argument("--profile", help="Profile JSON used for manifest lines without one")
+    parser.add_argument("--hint", default="", help="Form type hint passed to the LLM")
+    parser.add_argument("--stale-after", type=float, default=DEFAULT_STALE_CLAIM_S,
+                        help="Seconds without heartbeat before another worker takes over a shard")
+    parser.add_argument("--wait", action="store_true", help="Keep polling until every shard is complete")
+    args = parser.parse_args()
+
+    totals = run_batch(args.manifest, args.work_dir, args.out_dir, args.shards, args.workers,
+                       args.profile, args.hint, args.stale_after, args.wait)
+    raise SystemExit(1 if totals["error"] or (args.wait and totals["shards_incomplete"]) else 0)
+
+
+if __name__ == "__main__":
+    main()
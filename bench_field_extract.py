@@ -0,0 +1,128 @@
+"""Benchmark: AcroForm field extraction paths on forms with thousands of fields.
+
+Compares the unified field-tree extractor (form_fields.extract_acroform_fields) with
+the three previous paths: PyPDF2 ``get_form_text_fields``, the per-page PyMuPDF
+widget walk, and the pdfplumber text/image pass.
+
+    python bench_field_extract.py --fields 1000 5000 --repeat 3
+    python bench_field_extract.py --pdf sample_filled.pdf
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+from form_fields import extract_acroform_fields
+
+FIELDS_PER_PAGE = 60
+
+
+def make_synthetic_form(path, n_fields):
+    """Writes a form with ``n_fields`` text/checkbox/combobox fields spread over pages."""
+    doc = fitz.open()
+    page = None
+    for i in range(n_fields):
+        slot = i % FIELDS_PER_PAGE
+        if slot == 0:
+            page = doc.new_page()
+        x = 40 + (slot % 3) * 180
+        y = 40 + (slot // 3) * 36
+        widget = fitz.Widget()
+        widget.field_name = f"field_{i}"
+        widget.rect = fitz.Rect(x, y, x + 160, y + 18)
+        kind = i % 10
+        if kind == 8:
+            widget.field_type = fitz.PDF_WIDGET_TYPE_CHECKBOX
+        elif kind == 9:
+            widget.field_type = fitz.PDF_WIDGET_TYPE_COMBOBOX
+            widget.choice_values = ["Option A", "Option B", "Option C"]
+            widget.field_value = "Option A"
+        else:
+            widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+            widget.field_value = f"value {i}" if i % 2 else ""
+        page.add_widget(widget)
+    doc.save(path)
+    doc.close()
+
+
+def widget_walk(path):
+    fields = {}
+    with fitz.open(path) as doc:
+        for page in doc:
+            for field in page.widgets():
+                fields[field.field_name] = {
+                    "value": field.field_value,
+                    "rect": field.rect,
+                    "type": field.field_type,
+                    "options": field.choice_values if field.field_type in [fitz.PDF_WIDGET_TYPE_COMBOBOX, fitz.PDF_WIDGET_TYPE_LISTBOX] else None,
+                }
+    return fields
+
+
+def pypdf2_text_fields(path):
+    from PyPDF2 import PdfReader
+    return PdfReader(path).get_form_text_fields()
+
+
+def pdfplumber_text_and_images(path):
+    import pdfplumber
+    with pdfplumber.open(path) as pdf:
+        return [{"text": page.extract_text(), "images": page.images} for page in pdf.pages]
+
+
+EXTRACTORS = [
+    ("field tree (new)", extract_acroform_fields),
+    ("fitz widgets", widget_walk),
+    ("PyPDF2 text fields", pypdf2_text_fields),
+    ("pdfplumber text+images", pdfplumber_text_and_images),
+]
+
+
+def bench(path, repeat):
+    results = {}
+    for name, fn in EXTRACTORS:
+        times = []
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                out = fn(path)
+                times.append(time.perf_counter() - start)
+        except ImportError as e:
+            results[name] = f"skipped ({e.name} not installed)"
+            continue
+        results[name] = (statistics.median(times), len(out))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fields", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--pdf", help="Benchmark an existing PDF instead of synthetic forms")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        targets = []
+        if args.pdf:
+            targets.append((args.pdf, args.pdf))
+        else:
+            for n in args.fields:
+                path = os.path.join(tmp, f"form_{n}.pdf")
+                make_synthetic_form(path, n)
+                targets.append((f"synthetic, {n} fields", path))
+
+        for label, path in targets:
+            print(f"\n{label}")
+            for name, result in bench(path, args.repeat).items():
+                if isinstance(result, str):
+                    print(f"  {name:<24}{result}")
+                else:
+                    seconds, count = result
+                    print(f"  {name:<24}{seconds * 1000:>10.1f} ms  ({count} items)")
+
+
+if __name__ == "__main__":
+    main()
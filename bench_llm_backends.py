@@ -0,0 +1,105 @@
+"""Benchmark: latency and throughput of the LLM backends on the real mapping prompts.
+
+Every backend gets the same prompts, built with utils.build_mapping_prompt from the
+bundled forms and sample_profile.json. One warm-up call per backend (model load,
+connection setup) is excluded from the timings.
+
+    python bench_llm_backends.py --backends local gemini --repeat 5
+    python bench_llm_backends.py --backends llama_cpp --concurrency 1
+    python bench_llm_backends.py --backends local --concurrency 4 --pdf sample_filled.pdf
+"""
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from form_fields import extract_acroform_fields
+from llm_backends import BACKEND_NAMES, BackendUnavailable, get_backend
+from mapping_plan import profile_keys
+from utils import MAX_FIELD_TEXTS_FOR_PROMPT, build_mapping_prompt, decode_index_mappings, estimate_tokens
+
+
+def load_prompts(pdf_paths, profile_path, hint=""):
+    with open(profile_path, "r", encoding="utf-8") as f:
+        keys = profile_keys(json.load(f))
+    prompts = []
+    for path in pdf_paths:
+        names = list(extract_acroform_fields(path))[:MAX_FIELD_TEXTS_FOR_PROMPT]
+        if names:
+            prompts.append((path,) + build_mapping_prompt(names, keys, hint))
+    return prompts
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _timed_call(backend, prompt, labels, keys):
+    start = time.perf_counter()
+    text = backend.generate(prompt, json_output=True)
+    elapsed = time.perf_counter() - start
+    try:
+        mapped = sum(v != "NOMATCH" for v in decode_index_mappings(text, labels, keys).values())
+        valid = True
+    except ValueError:  # json.JSONDecodeError is a ValueError
+        mapped, valid = 0, False
+    return elapsed, estimate_tokens(text), valid, mapped
+
+
+def bench_backend(name, prompts, repeat, concurrency):
+    backend = get_backend(name)
+    _, prompt, labels, keys = prompts[0]
+    backend.generate(prompt, json_output=True)  # Warm-up
+
+    jobs = [p for _ in range(repeat) for p in prompts]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda job: _timed_call(backend, *job[1:]), jobs))
+    wall = time.perf_counter() - start
+
+    latencies = [r[0] for r in results]
+    return {
+        "backend": backend.describe(),
+        "calls": len(results),
+        "p50_s": statistics.median(latencies),
+        "p90_s": _percentile(latencies, 0.9),
+        "max_s": max(latencies),
+        "req_per_s": len(results) / wall,
+        "out_tok_per_s": sum(r[1] for r in results) / wall,
+        "valid": sum(r[2] for r in results) / len(results),
+        "mapped": statistics.mean(r[3] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["local", "gemini"], choices=BACKEND_NAMES)
+    parser.add_argument("--pdf", nargs="+", default=["sample_filled.pdf"])
+    parser.add_argument("--profile", default="sample_profile.json")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    prompts = load_prompts(args.pdf, args.profile)
+    if not prompts:
+        raise SystemExit("No AcroForm fields found in the given PDFs.")
+    print(f"{len(prompts)} prompt(s), ~{statistics.mean(estimate_tokens(p[1]) for p in prompts):.0f} tokens each, "
+          f"repeat {args.repeat}, concurrency {args.concurrency}")
+    print(f"{'backend':<40}{'p50 s':>8}{'p90 s':>8}{'max s':>8}{'req/s':>8}{'tok/s':>8}{'valid':>7}{'mapped':>8}")
+    for name in args.backends:
+        try:
+            r = bench_backend(name, prompts, args.repeat, args.concurrency)
+        except BackendUnavailable as e:
+            print(f"{name:<40}skipped ({e})")
+            continue
+        except Exception as e:
+            print(f"{name:<40}failed ({e})")
+            continue
+        print(f"{r['backend']:<40}{r['p50_s']:>8.2f}{r['p90_s']:>8.2f}{r['max_s']:>8.2f}"
+              f"{r['req_per_s']:>8.2f}{r['out_tok_per_s']:>8.1f}{r['valid']:>7.0%}{r['mapped']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark: Tesseract OCR with and without the ocr_preprocess pipeline, and label-only (ROI) OCR.
+
+Reports OCR time per page, Tesseract calls and label recall for each mode. ``roi`` runs
+utils.extract_form_labels_roi, which OCRs only the label crops next to detected fields. Recall is the share of
+reference lines whose words were all recognised; the reference defaults to the PDF's
+own text layer (Sample_scanned.pdf carries one) or can be given with ``--reference``.
+
+    python bench_ocr.py Sample_scanned.pdf --repeat 3
+"""
+import argparse
+import re
+import statistics
+import time
+
+import fitz  # PyMuPDF
+import pytesseract
+from pdf2image import convert_from_path
+
+from ocr_preprocess import OCR_DPI, TESSERACT_CONFIG, preprocess_page
+
+_WORD = re.compile(r"[a-z0-9]{2,}")
+
+
+def _words(text):
+    return _WORD.findall(text.lower())
+
+
+def reference_lines(pdf_path, reference_path=None):
+    if reference_path:
+        with open(reference_path, "r", encoding="utf-8") as f:
+            text = f.read()
+    else:
+        with fitz.open(pdf_path) as doc:
+            text = "\n".join(page.get_text("text") for page in doc)
+    return [words for words in (_words(line) for line in text.splitlines()) if words]
+
+
+def label_recall(ocr_text, ref_lines):
+    recognised = set(_words(ocr_text))
+    if not ref_lines:
+        return 0.0
+    hits = sum(all(word in recognised for word in words) for words in ref_lines)
+    return hits / len(ref_lines)
+
+
+def word_recall(ocr_text, ref_lines):
+    recognised = set(_words(ocr_text))
+    ref_words = [word for words in ref_lines for word in words]
+    return sum(word in recognised for word in ref_words) / len(ref_words) if ref_words else 0.0
+
+
+def run_mode(pdf_path, preprocess, repeat):
+    page_times, text = [], ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if preprocess:
+            images = convert_from_path(pdf_path, dpi=OCR_DPI, grayscale=True)
+        else:
+            images = convert_from_path(pdf_path)
+        render_s = time.perf_counter() - start
+
+        text = ""
+        for img in images:
+            page_start = time.perf_counter()
+            if preprocess:
+                text += pytesseract.image_to_string(preprocess_page(img, source_dpi=OCR_DPI), config=TESSERACT_CONFIG)
+            else:
+                text += pytesseract.image_to_string(img)
+            page_times.append(time.perf_counter() - page_start + render_s / len(images))
+    return page_times, text
+
+
+def run_roi(pdf_path, repeat):
+    from utils import extract_form_labels_roi
+    import metrics
+
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+    page_times, text = [], ""
+    calls_before = metrics.snapshot()["counters"].get("roi_tesseract_calls_total", 0)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        elements = extract_form_labels_roi(pdf_path)
+        page_times.extend([(time.perf_counter() - start) / page_count] * page_count)
+        text = "\n".join(item["text"] for item in elements)
+    calls = metrics.snapshot()["counters"].get("roi_tesseract_calls_total", 0) - calls_before
+    return page_times, text, calls / (repeat * page_count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdf", nargs="?", default="Sample_scanned.pdf")
+    parser.add_argument("--reference", help="Text file with the expected labels, one per line")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ref = reference_lines(args.pdf, args.reference)
+    print(f"{args.pdf}: {len(ref)} reference lines, {args.repeat} repeat(s)")
+    print(f"{'mode':<14}{'s/page (median)':>17}{'s/page (min)':>14}{'calls/page':>12}"
+          f"{'label recall':>14}{'word recall':>13}")
+    for name, preprocess in (("raw", False), ("preprocessed", True)):
+        page_times, text = run_mode(args.pdf, preprocess, args.repeat)
+        print(f"{name:<14}{statistics.median(page_times):>17.3f}{min(page_times):>14.3f}{1:>12.1f}"
+              f"{label_recall(text, ref):>14.1%}{word_recall(text, ref):>13.1%}")
+    page_times, text, calls_per_page = run_roi(args.pdf, args.repeat)
+    # Recall here is over all reference lines, most of which are not field labels
+    print(f"{'roi':<14}{statistics.median(page_times):>17.3f}{min(page_times):>14.3f}{calls_per_page:>12.1f}"
+          f"{label_recall(text, ref):>14.1%}{word_recall(text, ref):>13.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""Fast AcroForm field extraction straight from the PDF's field tree.
+
+``extract_acroform_fields`` walks ``/AcroForm /Fields`` by xref instead of loading every
+page and instantiating a PyMuPDF ``Widget`` per annotation, and returns one compact
+``FormField`` record per fully-qualified field name.
+"""
+import logging
+import re
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+# Field flag bits (PDF 32000-1, 12.7.4)
+FF_RADIO = 1 << 15
+FF_PUSHBUTTON = 1 << 16
+FF_COMBO = 1 << 17
+
+
+class FormField:
+    """One AcroForm field: name, widget type (``fitz.PDF_WIDGET_TYPE_*``), rect, value, options."""
+
+    __slots__ = ("name", "type", "rect", "value", "options", "page", "xref", "flags")
+
+    def __init__(self, name, type, rect, value, options=None, page=None, xref=0, flags=0):
+        self.name = name
+        self.type = type
+        self.rect = rect
+        self.value = value
+        self.options = options
+        self.page = page
+        self.xref = xref
+        self.flags = flags
+
+    @property
+    def type_string(self):
+        return _TYPE_NAMES.get(self.type, "Unknown")
+
+    def to_dict(self):
+        return {
+            "value": self.value,
+            "rect": tuple(self.rect) if self.rect is not None else None,
+            "type": self.type,
+            "type_string": self.type_string,
+            "options": self.options,
+            "page": self.page,
+        }
+
+    def __repr__(self):
+        return f"FormField({self.name!r}, {self.type_string}, value={self.value!r}, page={self.page})"
+
+
+_TYPE_NAMES = {
+    fitz.PDF_WIDGET_TYPE_BUTTON: "Button",
+    fitz.PDF_WIDGET_TYPE_CHECKBOX: "CheckBox",
+    fitz.PDF_WIDGET_TYPE_COMBOBOX: "ComboBox",
+    fitz.PDF_WIDGET_TYPE_LISTBOX: "ListBox",
+    fitz.PDF_WIDGET_TYPE_RADIOBUTTON: "RadioButton",
+    fitz.PDF_WIDGET_TYPE_SIGNATURE: "Signature",
+    fitz.PDF_WIDGET_TYPE_TEXT: "Text",
+}
+
+
+def _widget_type(field_type, flags):
+    if field_type == "Tx":
+        return fitz.PDF_WIDGET_TYPE_TEXT
+    if field_type == "Btn":
+        if flags & FF_PUSHBUTTON:
+            return fitz.PDF_WIDGET_TYPE_BUTTON
+        return fitz.PDF_WIDGET_TYPE_RADIOBUTTON if flags & FF_RADIO else fitz.PDF_WIDGET_TYPE_CHECKBOX
+    if field_type == "Ch":
+        return fitz.PDF_WIDGET_TYPE_COMBOBOX if flags & FF_COMBO else fitz.PDF_WIDGET_TYPE_LISTBOX
+    if field_type == "Sig":
+        return fitz.PDF_WIDGET_TYPE_SIGNATURE
+    return fitz.PDF_WIDGET_TYPE_UNKNOWN
+
+
+# --- Minimal PDF object syntax parsing (dicts, arrays, strings, numbers, names, refs) ---
+
+_TOKEN = re.compile(
+    rb"\s*(?:(<<)|(>>)|(\[)|(\])|(\()|<([0-9A-Fa-f\s]*)>|(\d+\s+\d+\s+R)|(/[^\s/\[\]()<>]*)|([^\s/\[\]()<>]+))"
+)
+_NAME_ESCAPE = re.compile(rb"#([0-9A-Fa-f]{2})")
+_ESCAPES = {ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t", ord("b"): b"\b", ord("f"): b"\f"}
+
+
+class PdfName(str):
+    """A PDF name (``/Tx``), kept distinct from strings; the leading slash is dropped."""
+    __slots__ = ()
+
+
+def _read_literal_string(data, pos):
+    """Reads a ``(...)`` string starting after the opening parenthesis."""
+    out = bytearray()
+    depth = 1
+    while pos < len(data):
+        c = data[pos]
+        if c == 0x5C:  # backslash
+            pos += 1
+            nxt = data[pos] if pos < len(data) else None
+            if nxt in _ESCAPES:
+                out += _ESCAPES[nxt]
+            elif nxt is not None and 0x30 <= nxt <= 0x37:
+                octal = re.match(rb"[0-7]{1,3}", data[pos:pos + 3]).group()
+                out.append(int(octal, 8) & 0xFF)
+                pos += len(octal) - 1
+            elif nxt not in (0x0A, 0x0D) and nxt is not None:
+                out.append(nxt)
+        elif c == 0x28:
+            depth += 1
+            out.append(c)
+        elif c == 0x29:
+            depth -= 1
+            if depth == 0:
+                return bytes(out), pos + 1
+            out.append(c)
+        else:
+            out.append(c)
+        pos += 1
+    return bytes(out), pos
+
+
+def _decode_pdf_string(raw):
+    if raw.startswith(b"\xfe\xff"):
+        return raw[2:].decode("utf-16-be", errors="replace")
+    return raw.decode("latin-1")
+
+
+def _decode_pdf_name(raw):
+    """Decodes the ``#hh`` escapes of a name token (without the slash): ``Yes#20Please``."""
+    raw = _NAME_ESCAPE.sub(lambda m: bytes([int(m.group(1), 16)]), raw)
+    try:
+        return raw.decode("utf-8")  # PDF 2.0 names are UTF-8; older files are mostly ASCII
+    except UnicodeDecodeError:
+        return raw.decode("latin-1")
+
+
+def parse_pdf_object(text):
+    """Parses PDF object syntax (as returned by ``Document.xref_object``) into Python values.
+
+    Dicts become ``dict`` (keys without the slash), arrays ``list``, strings ``str``,
+    names ``PdfName``, indirect references ``("ref", xref)``.
+    """
+    data = text.encode("latin-1", errors="replace") if isinstance(text, str) else text
+    stack = [("top", [])]
+    pos = 0
+    while pos < len(data):
+        match = _TOKEN.match(data, pos)
+        if not match or match.end() == pos:
+            break
+        pos = match.end()
+        open_dict, close_dict, open_arr, close_arr, open_str, hex_str, ref, name, other = match.groups()
+        items = stack[-1][1]
+        if open_dict:
+            stack.append(("dict", []))
+        elif open_arr:
+            stack.append(("array", []))
+        elif close_dict or close_arr:
+            if len(stack) > 1:
+                kind, done = stack.pop()
+                if kind == "dict":
+                    done = {str(done[k]): done[k + 1] for k in range(0, len(done) - 1, 2)}
+                stack[-1][1].append(done)
+        elif open_str:
+            raw, pos = _read_literal_string(data, pos)
+            items.append(_decode_pdf_string(raw))
+        elif hex_str is not None:
+            hex_digits = re.sub(rb"\s", b"", hex_str)
+            items.append(_decode_pdf_string(bytes.fromhex((hex_digits + b"0" * (len(hex_digits) % 2)).decode())))
+        elif ref:
+            items.append(("ref", int(ref.split()[0])))
+        elif name:
+            items.append(PdfName(_decode_pdf_name(name[1:])))
+        elif other:
+            token = other.decode("latin-1")
+            if token in ("true", "false"):
+                items.append(token == "true")
+            elif token == "null":
+                items.append(None)
+            else:
+                try:
+                    items.append(float(token) if "." in token else int(token))
+                except ValueError:
+                    items.append(token)
+    result = stack[0][1]
+    return result[0] if len(result) == 1 else result
+
+
+def _is_ref(value):
+    return isinstance(value, tuple) and len(value) == 2 and value[0] == "ref"
+
+
+class _FieldTreeReader:
+    """Reads objects by xref (one ``xref_object`` call each) and caches page geometry."""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._page_numbers = None
+        self._page_boxes = {}
+
+    def obj(self, xref):
+        return parse_pdf_object(self.doc.xref_object(xref, compressed=True))
+
+    def resolve(self, value):
+        return self.obj(value[1]) if _is_ref(value) else value
+
+    def page_number(self, page_ref):
+        if self._page_numbers is None:
+            self._page_numbers = {self.doc.page_xref(i): i for i in range(self.doc.page_count)}
+        return self._page_numbers.get(page_ref[1]) if _is_ref(page_ref) else None
+
+    def page_top(self, page_num):
+        """Returns ``(mediabox_x0, mediabox_y1)`` used to flip PDF coordinates to PyMuPDF's."""
+        if page_num not in self._page_boxes:
+            box = self.obj(self.doc.page_xref(page_num)).get("MediaBox")
+            box = self.resolve(box) if box is not None else None
+            if not isinstance(box, list) or len(box) != 4:
+                rect = self.doc.page_cropbox(page_num)
+                box = [rect.x0, 0, rect.x1, rect.y1]
+            self._page_boxes[page_num] = (float(box[0]), float(box[3]))
+        return self._page_boxes[page_num]
+
+
+def _field_rect(reader, widget):
+    rect = reader.resolve(widget.get("Rect"))
+    if not isinstance(rect, list) or len(rect) != 4:
+        return None, None
+    x0, y0, x1, y1 = (float(v) for v in rect)
+    page_num = reader.page_number(widget.get("P"))
+    if page_num is None:
+        return fitz.Rect(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)), None
+    left, top = reader.page_top(page_num)
+    return fitz.Rect(min(x0, x1) - left, top - max(y0, y1), max(x0, x1) - left, top - min(y0, y1)), page_num
+
+
+def _field_value(reader, value):
+    value = reader.resolve(value)
+    if value is None:
+        return ""
+    return str(value) if isinstance(value, PdfName) else value
+
+
+def extract_acroform_fields(doc_or_path):
+    """Returns ``{full_field_name: FormField}`` read from the AcroForm field tree.
+
+    Raises ``ValueError`` when the document has no AcroForm dictionary.
+    """
+    doc = fitz.open(doc_or_path) if not isinstance(doc_or_path, fitz.Document) else doc_or_path
+    try:
+        reader = _FieldTreeReader(doc)
+        acroform = reader.resolve(reader.obj(doc.pdf_catalog()).get("AcroForm"))
+        if not isinstance(acroform, dict):
+            raise ValueError("Document has no AcroForm dictionary.")
+        roots = reader.resolve(acroform.get("Fields")) or []
+
+        fields = {}
+        seen = set()
+        # Stack of (xref, parsed dict or None, parent name, inherited FT, inherited Ff, inherited V)
+        stack = [(ref[1], None, "", None, 0, None) for ref in reversed(roots) if _is_ref(ref)]
+        while stack:
+            xref, node, parent_name, field_type, flags, inherited_value = stack.pop()
+            if xref in seen:
+                continue  # Guard against cyclic Kids arrays in broken files
+            seen.add(xref)
+            if node is None:
+                node = reader.obj(xref)
+            if not isinstance(node, dict):
+                continue
+
+            partial = node.get("T")
+            name = f"{parent_name}.{partial}" if parent_name and partial else (partial or parent_name)
+            if isinstance(node.get("FT"), PdfName):
+                field_type = str(node["FT"])
+            if isinstance(node.get("Ff"), int):
+                flags = node["Ff"]
+            value = node["V"] if "V" in node else inherited_value
+
+            kid_refs = [ref for ref in (reader.resolve(node.get("Kids")) or []) if _is_ref(ref)]
+            kids = [(ref[1], reader.obj(ref[1])) for ref in kid_refs]
+            # Kids with their own /T are sub-fields; kids without are this field's widgets.
+            child_fields = [(kid_xref, kid) for kid_xref, kid in kids if isinstance(kid, dict) and "T" in kid]
+            if child_fields:
+                stack.extend((kid_xref, kid, name, field_type, flags, value) for kid_xref, kid in reversed(child_fields))
+                continue
+            if not name or name in fields:
+                continue
+
+            widget_xref, widget = kids[0] if kids and isinstance(kids[0][1], dict) else (xref, node)
+            rect, page_num = _field_rect(reader, widget)
+            widget_type = _widget_type(field_type, flags)
+            options = None
+            if widget_type in (fitz.PDF_WIDGET_TYPE_COMBOBOX, fitz.PDF_WIDGET_TYPE_LISTBOX):
+                options = reader.resolve(node.get("Opt"))
+                options = [[str(v) for v in opt] if isinstance(opt, list) else str(opt) for opt in options or []]
+            fields[name] = FormField(
+                name,
+                widget_type,
+                rect,
+                _field_value(reader, value),
+                options,
+                page_num,
+                widget_xref,
+                flags,
+            )
+        return fields
+    finally:
+        if doc is not doc_or_path:
+            doc.close()
@@ -0,0 +1,221 @@
+"""Pluggable LLM backends for field mapping.
+
+Every backend exposes ``generate(prompt, json_output=False) -> str``. ``get_backend(name)``
+returns a shared instance per name, so the backend can be picked per request:
+
+- ``gemini``     Google Gemini (``API_KEY`` / ``GOOGLE_API_KEY`` from the environment or .env)
+- ``local``      any OpenAI-compatible endpoint, e.g. ``llama-server -m qwen2.5-1.5b-instruct-q4_k_m.gguf``
+                 or Ollama; ``LOCAL_LLM_BASE_URL`` (default http://localhost:8080/v1), ``LOCAL_LLM_MODEL``
+- ``llama_cpp``  a GGUF model loaded in-process with llama-cpp-python (``LOCAL_LLM_MODEL_PATH``)
+- ``auto``       Gemini with the local endpoint as fallback when Gemini errors or takes
+                 longer than ``LLM_FALLBACK_TIMEOUT_S`` seconds; just the local endpoint
+                 when no Gemini key is configured
+
+``FORM_FILLER_LLM_BACKEND`` sets the default name (``auto``).
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from dotenv import load_dotenv
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DEFAULT_BACKEND = os.environ.get("FORM_FILLER_LLM_BACKEND", "auto")
+BACKEND_NAMES = ("auto", "gemini", "local", "llama_cpp")
+
+GEMINI_MODEL_NAME = "gemini-2.0-flash"
+LOCAL_BASE_URL = os.environ.get("LOCAL_LLM_BASE_URL", "http://localhost:8080/v1")
+LOCAL_MODEL_NAME = os.environ.get("LOCAL_LLM_MODEL", "qwen2.5-1.5b-instruct")
+LOCAL_REQUEST_TIMEOUT_S = 120
+FALLBACK_TIMEOUT_S = float(os.environ.get("LLM_FALLBACK_TIMEOUT_S", "20"))
+
+
+class BackendUnavailable(RuntimeError):
+    """The backend cannot be used here (missing key, package or model file)."""
+
+
+class LLMBackend:
+    name = "base"
+    model = ""
+
+    def generate(self, prompt, json_output=False):
+        raise NotImplementedError
+
+    def describe(self):
+        return f"{self.name}:{self.model}" if self.model else self.name
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, model=GEMINI_MODEL_NAME, api_key=None):
+        self.model = model
+        self._api_key = api_key or os.environ.get("API_KEY") or os.environ.get("GOOGLE_API_KEY")
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            if not self._api_key:
+                raise BackendUnavailable("Google API key not found (set API_KEY or GOOGLE_API_KEY).")
+            try:
+                import google.generativeai as genai
+            except ImportError as e:
+                raise BackendUnavailable(f"google-generativeai is not installed: {e}") from e
+            genai.configure(api_key=self._api_key)
+            self._client = genai.GenerativeModel(self.model)
+        return self._client
+
+    def generate(self, prompt, json_output=False):
+        client = self._get_client()
+        generation_config = {"temperature": 0}
+        if json_output:
+            generation_config["response_mime_type"] = "application/json"
+        with metrics.stage("llm_generate", backend=self.name, model=self.model):
+            response = client.generate_content(prompt, generation_config=generation_config)
+        metrics.record_llm_usage(response, backend=self.name)
+        return response.text
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Chat completions against an OpenAI-compatible server (llama.cpp server, Ollama, vLLM)."""
+
+    name = "local"
+
+    def __init__(self, base_url=LOCAL_BASE_URL, model=LOCAL_MODEL_NAME, api_key=None,
+                 timeout_s=LOCAL_REQUEST_TIMEOUT_S):
+        self.base_url = base_url
+        self.model = model
+        self._api_key = api_key or os.environ.get("LOCAL_LLM_API_KEY", "not-needed")
+        self._timeout_s = timeout_s
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            try:
+                from openai import OpenAI
+            except ImportError as e:
+                raise BackendUnavailable(f"openai is not installed: {e}") from e
+            self._client = OpenAI(base_url=self.base_url, api_key=self._api_key,
+                                  timeout=self._timeout_s, max_retries=0)
+        return self._client
+
+    def generate(self, prompt, json_output=False):
+        kwargs = {"response_format": {"type": "json_object"}} if json_output else {}
+        with metrics.stage("llm_generate", backend=self.name, model=self.model):
+            response = self._get_client().chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                **kwargs,
+            )
+        metrics.record_llm_usage(response, backend=self.name)
+        return response.choices[0].message.content or ""
+
+
+class LlamaCppBackend(LLMBackend):
+    """A quantized GGUF model run in-process on the CPU (no server, no network)."""
+
+    name = "llama_cpp"
+
+    def __init__(self, model_path=None, n_ctx=8192, n_threads=None):
+        self.model_path = model_path or os.environ.get("LOCAL_LLM_MODEL_PATH")
+        self.model = os.path.basename(self.model_path) if self.model_path else ""
+        self._n_ctx = n_ctx
+        self._n_threads = n_threads
+        self._llm = None
+        self._lock = threading.Lock()  # A llama.cpp context serves one generation at a time
+
+    def _get_llm(self):
+        if self._llm is None:
+            if not self.model_path or not os.path.exists(self.model_path):
+                raise BackendUnavailable("Set LOCAL_LLM_MODEL_PATH to a GGUF model file.")
+            try:
+                from llama_cpp import Llama
+            except ImportError as e:
+                raise BackendUnavailable(f"llama-cpp-python is not installed: {e}") from e
+            with metrics.stage("llm_model_load", backend=self.name, model=self.model):
+                self._llm = Llama(model_path=self.model_path, n_ctx=self._n_ctx,
+                                  n_threads=self._n_threads, verbose=False)
+        return self._llm
+
+    def generate(self, prompt, json_output=False):
+        kwargs = {"response_format": {"type": "json_object"}} if json_output else {}
+        with self._lock:
+            llm = self._get_llm()
+            with metrics.stage("llm_generate", backend=self.name, model=self.model):
+                response = llm.create_chat_completion(
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0,
+                    **kwargs,
+                )
+        metrics.record_llm_usage(response, backend=self.name)
+        return response["choices"][0]["message"]["content"] or ""
+
+
+# Remote calls that time out keep running in the background; a small shared pool bounds them.
+_fallback_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-fallback")
+
+
+class FallbackBackend(LLMBackend):
+    """Tries ``primary`` and switches to ``fallback`` on error or after ``timeout_s`` seconds."""
+
+    name = "auto"
+
+    def __init__(self, primary, fallback, timeout_s=FALLBACK_TIMEOUT_S):
+        self.primary = primary
+        self.fallback = fallback
+        self.timeout_s = timeout_s
+        self.model = f"{primary.describe()}->{fallback.describe()}"
+
+    def generate(self, prompt, json_output=False):
+        future = _fallback_pool.submit(metrics.run_in_context(self.primary.generate), prompt, json_output)
+        try:
+            return future.result(timeout=self.timeout_s)
+        except FutureTimeoutError:
+            reason = "timeout"
+            logger.warning(f"{self.primary.describe()} did not answer within {self.timeout_s:g}s; "
+                           f"falling back to {self.fallback.describe()}.")
+        except Exception as e:
+            reason = "unavailable" if isinstance(e, BackendUnavailable) else "error"
+            logger.warning(f"{self.primary.describe()} failed ({e}); falling back to {self.fallback.describe()}.")
+        metrics.inc("llm_fallbacks_total", primary=self.primary.name, reason=reason)
+        return self.fallback.generate(prompt, json_output=json_output)
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def _build_backend(name):
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "local":
+        return OpenAICompatibleBackend()
+    if name == "llama_cpp":
+        return LlamaCppBackend()
+    if name == "auto":
+        if os.environ.get("API_KEY") or os.environ.get("GOOGLE_API_KEY"):
+            return FallbackBackend(get_backend("gemini"), get_backend("local"))
+        return get_backend("local")
+    raise ValueError(f"Unknown LLM backend '{name}'. Choose one of: {', '.join(BACKEND_NAMES)}.")
+
+
+def get_backend(backend=None):
+    """Returns the shared backend for a name (or passes an ``LLMBackend`` instance through)."""
+    if isinstance(backend, LLMBackend):
+        return backend
+    name = (backend or DEFAULT_BACKEND).strip().lower()
+    with _backends_lock:
+        instance = _backends.get(name)
+    if instance is None:
+        instance = _build_backend(name)
+        with _backends_lock:
+            instance = _backends.setdefault(name, instance)
+    return instance
@@ -0,0 +1,303 @@
+"""Load test: simulated concurrent users running analyze -> map -> fill through utils.py.
+
+Requests are drawn from a weighted mix of AcroForm and scanned uploads, built from the
+bundled PDFs plus synthetic ones (a large generated AcroForm and an image-only scan).
+The LLM is a stub backend that answers the real mapping prompt after a configurable
+delay, so runs are repeatable and cost nothing:
+
+    python loadtest.py --requests 200 --concurrency 8 --llm-latency 1.5
+    python loadtest.py --requests 100 --concurrency 4 --mode process --rate 2 --json out.json
+
+Without ``--rate`` all requests arrive at once (a backlog); with it they arrive as a
+Poisson stream of that many requests per second. Queueing delay is the time between a
+request's arrival and a worker picking it up; latency is arrival to completion.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+
+import metrics
+from bench_field_extract import make_synthetic_form
+from llm_backends import LLMBackend
+
+DEFAULT_MIX = "acroform=0.7,scanned=0.3"
+SYNTHETIC_FORM_FIELDS = 600
+SCAN_DPI = 150
+
+
+class StubBackend(LLMBackend):
+    """Answers mapping prompts by word overlap after ``latency_s`` (+/- ``jitter`` share)."""
+
+    name = "stub"
+
+    def __init__(self, latency_s=1.0, jitter=0.2, seed=None):
+        self.model = f"{latency_s:g}s"
+        self.latency_s = latency_s
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    @staticmethod
+    def _tokens(text):
+        spaced = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+        return {t for t in re.split(r"[^a-z0-9]+", spaced.lower()) if len(t) > 2}
+
+    def _parse_prompt(self, prompt):
+        keys, labels, section = {}, {}, None
+        for line in prompt.splitlines():
+            if line in ("K:", "L:"):
+                section = keys if line == "K:" else labels
+                continue
+            index, _, text = line.partition(" ")
+            if section is not None and index.isdigit():
+                section[index] = self._tokens(text)
+        return keys, labels
+
+    def generate(self, prompt, json_output=False):
+        delay = self.latency_s * (1 + self._random.uniform(-self.jitter, self.jitter))
+        with metrics.stage("llm_generate", backend=self.name, model=self.model):
+            time.sleep(max(0.0, delay))
+            keys, labels = self._parse_prompt(prompt)
+            answer = {}
+            for label_idx, label_tokens in labels.items():
+                best = max(keys.items(), key=lambda kv: len(kv[1] & label_tokens), default=None)
+                if best and best[1] & label_tokens:
+                    answer[label_idx] = [int(best[0])]
+        metrics.inc("llm_tokens_total", (len(prompt) + 3) // 4, kind="prompt", backend=self.name)
+        return json.dumps(answer)
+
+
+def _make_image_only_scan(source_pdf, out_path, dpi=SCAN_DPI):
+    """Renders each page of ``source_pdf`` into an image-only PDF, like a scanner would."""
+    with fitz.open(source_pdf) as src, fitz.open() as out:
+        for page in src:
+            pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+            new_page = out.new_page(width=page.rect.width, height=page.rect.height)
+            new_page.insert_image(new_page.rect, pixmap=pix)
+        out.save(out_path, garbage=1, deflate=True)
+
+
+def build_workload(work_dir):
+    """Returns ``{kind: [pdf paths]}`` with the bundled and synthetic documents."""
+    synthetic_form = os.path.join(work_dir, f"synthetic_form_{SYNTHETIC_FORM_FIELDS}.pdf")
+    make_synthetic_form(synthetic_form, SYNTHETIC_FORM_FIELDS)
+    synthetic_scan = os.path.join(work_dir, "synthetic_scan.pdf")
+    _make_image_only_scan("sample_filled.pdf", synthetic_scan)
+    return {
+        "acroform": ["sample_filled.pdf", synthetic_form],
+        "scanned": ["Sample_scanned.pdf", "drylab.pdf", synthetic_scan],
+    }
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def make_schedule(n_requests, mix, workload, rate, seed):
+    """Returns ``[(arrival_offset_s, kind, pdf_path)]``; Poisson arrivals when ``rate`` > 0."""
+    rng = random.Random(seed)
+    kinds = [k for k in mix if workload.get(k)]
+    weights = [mix[k] for k in kinds]
+    schedule, t = [], 0.0
+    for _ in range(n_requests):
+        if rate:
+            t += rng.expovariate(rate)
+        kind = rng.choices(kinds, weights)[0]
+        schedule.append((t, kind, rng.choice(workload[kind])))
+    return schedule
+
+
+_worker_backends = {}
+
+
+def _peak_rss_kb():
+    """Peak RSS of this process in KiB, or None when it cannot be read here."""
+    try:
+        import resource  # POSIX only
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) // 1024  # peak_wset: Windows peak working set
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # Bytes on macOS, KiB on Linux
+
+
+def run_request(kind, pdf_path, profile, out_dir, llm_latency_s, ocr_mode, arrival_wall):
+    """One simulated user request: analyze -> map -> fill (AcroForm) or analyze -> map (scanned)."""
+    from mapping_plan import compile_mapping_plan, profile_keys
+    from utils import (check_pdf_basic_properties, extract_text_elements_unstructured,
+                       fill_acroform_pdf_report, get_acroform_fields, get_llm_mappings)
+
+    start_wall = time.time()
+    backend = _worker_backends.get(llm_latency_s)
+    if backend is None:
+        backend = _worker_backends.setdefault(llm_latency_s, StubBackend(llm_latency_s))
+    result = {"kind": kind, "pdf": os.path.basename(pdf_path), "status": "ok", "pid": os.getpid(),
+              "thread": threading.get_ident(), "arrival": arrival_wall, "start": start_wall}
+    try:
+        with metrics.trace("loadtest_request", kind=kind, pdf=result["pdf"]) as request_trace:
+            check_pdf_basic_properties(pdf_path)
+            fields = get_acroform_fields(pdf_path) if kind == "acroform" else None
+            if fields:
+                labels = list(fields)
+            else:
+                elements = extract_text_elements_unstructured(pdf_path, ocr_mode=ocr_mode)
+                labels = [item["text"] for item in elements]
+            mappings = get_llm_mappings(labels, profile_keys(profile), backend=backend)
+            if not isinstance(mappings, dict) or "error" in mappings:
+                raise RuntimeError(f"mapping failed: {mappings}")
+            if fields:
+                output_path = os.path.join(out_dir, f"filled_{os.getpid()}_{threading.get_ident()}.pdf")
+                report = fill_acroform_pdf_report(pdf_path, output_path,
+                                                  compile_mapping_plan(mappings).apply(profile, fields=fields))
+                if "error" in report:
+                    raise RuntimeError(report["error"])
+        result["stages"] = {}
+        for span in request_trace["spans"]:
+            result["stages"][span["name"]] = result["stages"].get(span["name"], 0.0) + span.get("duration_s", 0.0)
+    except Exception as e:
+        result.update(status="error", error=str(e))
+    result["end"] = time.time()
+    result["max_rss_kb"] = _peak_rss_kb()  # Of the whole process
+    return result
+
+
+def _percentiles(values, qs=(0.5, 0.9, 0.99)):
+    if not values:
+        return {f"p{int(q * 100)}": None for q in qs}
+    ordered = sorted(values)
+    return {f"p{int(q * 100)}": ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] for q in qs}
+
+
+def run_load(schedule, profile, concurrency, mode, llm_latency_s, ocr_mode, out_dir):
+    executor_cls = ProcessPoolExecutor if mode == "process" else ThreadPoolExecutor
+    futures = []
+    with executor_cls(max_workers=concurrency) as pool:
+        t0 = time.time()
+        for offset, kind, pdf_path in schedule:
+            delay = t0 + offset - time.time()
+            if delay > 0:
+                time.sleep(delay)  # Open-loop arrivals: submit on schedule, never wait for results
+            futures.append(pool.submit(run_request, kind, pdf_path, profile, out_dir,
+                                       llm_latency_s, ocr_mode, time.time()))
+        results = [future.result() for future in futures]
+    return results, time.time() - t0
+
+
+def summarize(results, wall_s, concurrency, mode):
+    ok = [r for r in results if r["status"] == "ok"]
+    latency = [r["end"] - r["arrival"] for r in ok]
+    queueing = [r["start"] - r["arrival"] for r in results]
+    service = [r["end"] - r["start"] for r in ok]
+    stage_totals = {}
+    for r in ok:
+        for name, seconds in r.get("stages", {}).items():
+            stage_totals.setdefault(name, []).append(seconds)
+
+    # Peak RSS per worker process. Thread workers share one process whose RSS also holds
+    # the interpreter, imports and caches, so no per-worker figure is derived from it.
+    rss_by_pid = {}
+    for r in results:
+        if r["max_rss_kb"] is not None:
+            rss_by_pid[r["pid"]] = max(rss_by_pid.get(r["pid"], 0), r["max_rss_kb"])
+    per_worker_mb = [kb / 1024 for kb in rss_by_pid.values()] if mode == "process" else []
+
+    by_kind = {}
+    for r in ok:
+        by_kind.setdefault(r["kind"], []).append(r["end"] - r["arrival"])
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "wall_s": wall_s,
+        "throughput_rps": len(ok) / wall_s if wall_s else 0.0,
+        "latency_s": _percentiles(latency),
+        "queueing_s": _percentiles(queueing),
+        "service_s": _percentiles(service),
+        "latency_by_kind_s": {kind: _percentiles(values) for kind, values in by_kind.items()},
+        "stage_mean_s": {name: statistics.mean(values) for name, values in sorted(stage_totals.items())},
+        "peak_rss_mb": max(rss_by_pid.values()) / 1024 if rss_by_pid else None,
+        "rss_per_worker_mb": statistics.mean(per_worker_mb) if per_worker_mb else None,
+        "worker_processes": len({r["pid"] for r in results}),
+        "error_samples": sorted({r["error"] for r in results if r["status"] != "ok"})[:5],
+    }
+
+
+def _fmt(p):
+    return " ".join(f"{k}={v:.2f}" if v is not None else f"{k}=-" for k, v in p.items())
+
+
+def print_summary(s):
+    print(f"\n{s['requests']} requests, {s['errors']} errors, {s['concurrency']} {s['mode']} workers, "
+          f"{s['wall_s']:.1f}s wall")
+    print(f"  throughput        {s['throughput_rps']:.2f} req/s")
+    print(f"  latency (s)       {_fmt(s['latency_s'])}")
+    print(f"  queueing (s)      {_fmt(s['queueing_s'])}")
+    print(f"  service (s)       {_fmt(s['service_s'])}")
+    for kind, p in s["latency_by_kind_s"].items():
+        print(f"  latency {kind:<10}{_fmt(p)}")
+    if s["peak_rss_mb"] is None:
+        memory = "n/a (install psutil to measure peak RSS on this platform)"
+    else:
+        memory = f"peak RSS {s['peak_rss_mb']:.0f} MB over {s['worker_processes']} process(es)"
+    if s["rss_per_worker_mb"] is not None:
+        memory += f", ~{s['rss_per_worker_mb']:.0f} MB per worker"
+    print(f"  memory            {memory}")
+    print("  mean stage time (s)")
+    width = max(map(len, s["stage_mean_s"]), default=0) + 2
+    for name, seconds in s["stage_mean_s"].items():
+        print(f"    {name:<{width}}{seconds:.3f}")
+    for error in s["error_samples"]:
+        print(f"  error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mode", choices=("thread", "process"), default="thread",
+                        help="thread: like Streamlit sessions in one server; process: like batch workers")
+    parser.add_argument("--rate", type=float, default=0.0, help="Arrivals per second (0: all at once)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Workload weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Stub LLM latency in seconds")
+    parser.add_argument("--ocr-mode", choices=("full", "roi"), default="roi")
+    parser.add_argument("--profile", default="sample_profile.json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the summary to this file (for comparing runs)")
+    args = parser.parse_args()
+
+    with open(args.profile, "r", encoding="utf-8") as f:
+        profile = json.load(f)
+
+    with tempfile.TemporaryDirectory(prefix="loadtest_") as work_dir:
+        workload = build_workload(work_dir)
+        schedule = make_schedule(args.requests, parse_mix(args.mix), workload, args.rate, args.seed)
+        results, wall_s = run_load(schedule, profile, args.concurrency, args.mode,
+                                   args.llm_latency, args.ocr_mode, work_dir)
+
+    summary = summarize(results, wall_s, args.concurrency, args.mode)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
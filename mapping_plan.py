@@ -0,0 +1,208 @@
+"""Compiled "mapping plans": LLM mappings resolved once, applied to any number of profiles.
+
+A mapping such as ``{"Full Name": "firstName, lastName", "DOB": "dateOfBirth | date:%d/%m/%Y"}``
+is parsed a single time into key paths and transform callables.  ``MappingPlan.apply``
+then only walks dictionaries, which keeps batch fills over many profiles a tight loop.
+
+Key paths may point into nested profiles (``address.city``, ``phones.0``); ``profile_keys``
+lists them so the LLM is offered the same dotted keys.  Transforms are given inline after
+a ``|`` or per field through ``compile_mapping_plan(transforms=...)``:
+
+- ``date:<strftime format>``  re-formats ISO / common date strings, e.g. ``date:%m/%d/%Y``
+- ``phone`` / ``phone:digits``  normalises to ``+<digits>`` or bare digits
+- ``upper`` / ``lower`` / ``title`` / ``strip``
+"""
+import datetime
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+NOMATCH = "NOMATCH"
+
+_MISSING = object()
+
+_DATE_INPUT_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%m/%d/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y%m%d")
+_NON_DIGITS = re.compile(r"\D")
+
+
+def _date_transform(output_format):
+    def transform(value):
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.strftime(output_format)
+        text = str(value).strip()
+        for input_format in _DATE_INPUT_FORMATS:
+            try:
+                return datetime.datetime.strptime(text, input_format).strftime(output_format)
+            except ValueError:
+                continue
+        return text  # Leave unrecognised dates untouched rather than dropping them
+    return transform
+
+
+def _phone_transform(style):
+    def transform(value):
+        text = str(value).strip()
+        digits = _NON_DIGITS.sub("", text)
+        if style == "digits" or not text.startswith("+"):
+            return digits
+        return "+" + digits
+    return transform
+
+
+_SIMPLE_TRANSFORMS = {
+    "upper": lambda v: str(v).upper(),
+    "lower": lambda v: str(v).lower(),
+    "title": lambda v: str(v).title(),
+    "strip": lambda v: str(v).strip(),
+}
+
+
+def compile_transform(spec):
+    """Turns a transform spec (``"date:%d/%m/%Y"``, ``"phone"`` ...) into a callable."""
+    if not spec:
+        return None
+    if not isinstance(spec, str):
+        raise ValueError(f"Transform spec must be a string, got {spec!r}.")
+    name, _, arg = spec.strip().partition(":")
+    name = name.strip().lower()
+    if name == "date":
+        return _date_transform(arg or "%Y-%m-%d")
+    if name == "phone":
+        return _phone_transform(arg.strip().lower() or "e164")
+    if name in _SIMPLE_TRANSFORMS:
+        return _SIMPLE_TRANSFORMS[name]
+    raise ValueError(f"Unknown transform '{spec}'.")
+
+
+def _compile_path(key):
+    """Splits ``"address.city"`` into path segments."""
+    return tuple(key.split("."))
+
+
+def _resolve(profile, key, path):
+    # A literal (possibly dotted) top-level key always wins over a nested lookup.
+    value = profile.get(key, _MISSING)
+    if value is not _MISSING or len(path) == 1:
+        return value
+    value = profile
+    for part in path:
+        # Segments stay strings for dicts ({"1": ...}); only lists are indexed by number
+        if isinstance(value, (list, tuple)):
+            if not part.isdigit():
+                return _MISSING
+            part = int(part)
+        try:
+            value = value[part]
+        except (KeyError, IndexError, TypeError):
+            return _MISSING
+    return value
+
+
+def profile_keys(profile, prefix=""):
+    """Lists the key paths of ``profile`` for the mapping prompt, flattening nested values.
+
+    ``{"name": ..., "address": {"city": ...}, "phones": ["..."]}`` gives
+    ``["name", "address.city", "phones.0"]``; every path resolves in ``MappingPlan.apply``.
+    """
+    keys = []
+    items = profile.items() if isinstance(profile, dict) else enumerate(profile)
+    for key, value in items:
+        path = f"{prefix}{key}"
+        if isinstance(value, (dict, list)) and value:
+            keys.extend(profile_keys(value, f"{path}."))
+        else:
+            keys.append(path)
+    return keys
+
+
+class MappingPlan:
+    """Field mappings compiled into key paths and transforms. Build with ``compile_mapping_plan``."""
+
+    __slots__ = ("entries",)
+
+    def __init__(self, entries):
+        # Each entry: (pdf_field, mapping_text, ((key, path), ...), transform_or_None)
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _value(self, profile, keys, transform, missing):
+        if len(keys) == 1:
+            key, path = keys[0]
+            value = _resolve(profile, key, path)
+            if value is _MISSING:
+                return missing
+        else:
+            parts = []
+            for key, path in keys:
+                part = _resolve(profile, key, path)
+                if part is not _MISSING:
+                    parts.append(str(part))
+            if not parts:
+                return missing
+            value = " ".join(parts).strip()
+        return transform(value) if transform is not None else value
+
+    def apply(self, profile, fields=None, missing=""):
+        """Returns ``{pdf_field: value}`` for one profile, optionally limited to ``fields``."""
+        data = {}
+        for pdf_field, _, keys, transform in self.entries:
+            if fields is not None and pdf_field not in fields:
+                continue
+            data[pdf_field] = self._value(profile, keys, transform, missing)
+        return data
+
+    def apply_many(self, profiles, fields=None, missing=""):
+        """Applies the plan to every profile in ``profiles``, yielding one data dict each."""
+        if fields is not None:
+            fields = set(fields)
+        for profile in profiles:
+            yield self.apply(profile, fields, missing)
+
+    def rows(self, profile, missing="KEY_NOT_FOUND"):
+        """Yields ``(pdf_field, mapping_text, value)`` for display and text exports."""
+        for pdf_field, mapping_text, keys, transform in self.entries:
+            yield pdf_field, mapping_text, self._value(profile, keys, transform, missing)
+
+    def missing_keys(self, profile):
+        """Lists ``(pdf_field, key)`` pairs whose key is absent from ``profile``."""
+        return [
+            (pdf_field, key)
+            for pdf_field, _, keys, _ in self.entries
+            for key, path in keys
+            if _resolve(profile, key, path) is _MISSING
+        ]
+
+
+def compile_mapping_plan(mappings, transforms=None):
+    """Compiles LLM mappings (``{pdf_field: "key1, key2 | transform"}``) into a ``MappingPlan``.
+
+    ``NOMATCH`` and empty mappings are dropped.  ``transforms`` optionally maps pdf fields
+    to transform specs and overrides any inline ``| spec``.
+    """
+    if not isinstance(mappings, dict):
+        logger.error(f"Cannot compile mapping plan, mappings is not a dictionary: {mappings}")
+        return MappingPlan([])
+
+    transforms = transforms or {}
+    entries = []
+    for pdf_field, mapping_text in mappings.items():
+        if mapping_text is None or mapping_text == NOMATCH or not isinstance(mapping_text, str):
+            continue
+        keys_text, _, inline_spec = mapping_text.partition("|")
+        keys = tuple(
+            (key, _compile_path(key))
+            for key in (k.strip() for k in keys_text.split(","))
+            if key
+        )
+        if not keys:
+            continue
+        try:
+            transform = compile_transform(transforms.get(pdf_field) or inline_spec)
+        except ValueError as e:
+            logger.warning(f"{e} Ignoring it for PDF field '{pdf_field}'.")
+            transform = None
+        entries.append((pdf_field, mapping_text, keys, transform))
+    return MappingPlan(entries)
@@ -0,0 +1,264 @@
+"""Per-stage timing, counters and trace export for the form-filling pipeline.
+
+Stages (``partition_pdf``, OCR, LLM calls, ``doc.save`` ...) are wrapped in
+``stage(...)`` blocks.  Every stage updates a process-wide histogram and, when a
+request trace is active (see ``trace(...)``), appends a span to that trace so a
+single document can be inspected as JSON afterwards.
+"""
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets (seconds) used for every stage timing.
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Optional profiling hook, driven by the environment so it can be enabled in production.
+PROFILE_DIR = os.environ.get("FORM_FILLER_PROFILE_DIR")
+PROFILE_THRESHOLD_S = float(os.environ.get("FORM_FILLER_PROFILE_THRESHOLD_S", "10"))
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_stage_timings = {}  # stage name -> {"count", "sum", "buckets"}
+_current_trace = ContextVar("current_trace", default=None)
+_current_span = ContextVar("current_span", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Increments a counter, e.g. ``inc("pages_processed_total", 3)``."""
+    key = (name, _label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    current = _current_trace.get()
+    if current is not None:
+        counter_name = name + "".join(f"{{{k}={v}}}" for k, v in key[1])
+        current["counters"][counter_name] = current["counters"].get(counter_name, 0) + value
+
+
+def cache_hit(cache_name):
+    inc("cache_hits_total", cache=cache_name)
+
+
+def cache_miss(cache_name):
+    inc("cache_misses_total", cache=cache_name)
+
+
+def record_llm_usage(response, backend="gemini"):
+    """Records prompt/completion token counts from an LLM response, when the SDK reports them.
+
+    Understands Gemini ``usage_metadata``, OpenAI-style ``usage`` objects and the plain
+    ``usage`` dict returned by llama-cpp-python.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        completion_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    else:
+        usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+        if usage is None:
+            return
+        if isinstance(usage, dict):
+            prompt_tokens = usage.get("prompt_tokens", 0) or 0
+            completion_tokens = usage.get("completion_tokens", 0) or 0
+        else:
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    inc("llm_tokens_total", prompt_tokens, kind="prompt", backend=backend)
+    inc("llm_tokens_total", completion_tokens, kind="completion", backend=backend)
+
+
+def _observe(stage_name, seconds):
+    with _lock:
+        timing = _stage_timings.get(stage_name)
+        if timing is None:
+            timing = {"count": 0, "sum": 0.0, "buckets": [0] * len(STAGE_BUCKETS)}
+            _stage_timings[stage_name] = timing
+        timing["count"] += 1
+        timing["sum"] += seconds
+        for i, bound in enumerate(STAGE_BUCKETS):
+            if seconds <= bound:
+                timing["buckets"][i] += 1
+
+
+@contextmanager
+def stage(name, **attrs):
+    """Times a pipeline stage and records it as a span in the current trace (if any)."""
+    current = _current_trace.get()
+    span = None
+    token = None
+    if current is not None:
+        parent = _current_span.get()
+        span = {
+            "name": name,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent["span_id"] if parent else None,
+            "start_offset_s": round(time.perf_counter() - current["_t0"], 6),
+            "attrs": dict(attrs),
+        }
+        current["spans"].append(span)
+        token = _current_span.set(span)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield span if span is not None else {}
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _observe(name, elapsed)
+        if status == "error":
+            inc("stage_errors_total", stage=name)
+        if span is not None:
+            span["duration_s"] = round(elapsed, 6)
+            span["status"] = status
+            _current_span.reset(token)
+
+
+@contextmanager
+def trace(name, **attrs):
+    """Collects all stages/counters of one request into a JSON-serialisable trace.
+
+    When ``FORM_FILLER_PROFILE_DIR`` is set, the request also runs under cProfile and
+    the stats are dumped there if it took longer than ``FORM_FILLER_PROFILE_THRESHOLD_S``.
+    """
+    current = {
+        "trace_id": uuid.uuid4().hex,
+        "name": name,
+        "attrs": dict(attrs),
+        "started_at": time.time(),
+        "spans": [],
+        "counters": {},
+        "_t0": time.perf_counter(),
+    }
+    trace_token = _current_trace.set(current)
+    span_token = _current_span.set(None)
+    try:
+        with profile_if_slow(name, trace_id=current["trace_id"]):
+            with stage(name, **attrs):
+                yield current
+    finally:
+        current["duration_s"] = round(time.perf_counter() - current["_t0"], 6)
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        logger.info(f"Trace '{name}' ({current['trace_id']}) finished in {current['duration_s']:.3f}s "
+                    f"with {len(current['spans'])} spans.")
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def run_in_context(fn):
+    """Wraps ``fn`` so that, run on another thread, its stages land in the caller's trace."""
+    context = copy_context()
+
+    def wrapper(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+    return wrapper
+
+
+def trace_to_json(trace_dict, indent=None):
+    """Serialises a trace returned by ``trace(...)`` (internal fields are dropped)."""
+    public = {k: v for k, v in trace_dict.items() if not k.startswith("_")}
+    return json.dumps(public, indent=indent, default=str)
+
+
+@contextmanager
+def profile_if_slow(name, trace_id=None, out_dir=None, threshold_s=None):
+    """Runs the block under cProfile and dumps a ``.prof`` file if it was slow.
+
+    The dump is standard pstats output, readable by ``python -m pstats``, snakeviz or
+    gprof2dot.  Disabled unless ``out_dir`` or ``FORM_FILLER_PROFILE_DIR`` is given.
+    """
+    out_dir = out_dir or PROFILE_DIR
+    threshold_s = PROFILE_THRESHOLD_S if threshold_s is None else threshold_s
+    if not out_dir:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active on this thread (nested trace); skip.
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        if elapsed >= threshold_s:
+            os.makedirs(out_dir, exist_ok=True)
+            safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+            path = os.path.join(out_dir, f"{safe_name}-{trace_id or uuid.uuid4().hex}.prof")
+            profiler.dump_stats(path)
+            logger.warning(f"'{name}' took {elapsed:.2f}s (threshold {threshold_s}s); profile written to '{path}'.")
+
+
+def _escape_label_value(value):
+    """Escapes a label value as the text exposition format requires (backslash, quote, newline)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in labels) + "}"
+
+
+def prometheus_text():
+    """Renders all counters and stage histograms in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        timings = {k: {"count": v["count"], "sum": v["sum"], "buckets": list(v["buckets"])}
+                   for k, v in _stage_timings.items()}
+
+    lines = []
+    seen_names = set()
+    for (name, labels), value in sorted(counters.items()):
+        metric = f"form_filler_{name}"
+        if metric not in seen_names:
+            lines.append(f"# TYPE {metric} counter")
+            seen_names.add(metric)
+        lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+    if timings:
+        metric = "form_filler_stage_duration_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for stage_name, timing in sorted(timings.items()):
+            stage_name = _escape_label_value(stage_name)
+            for bound, count in zip(STAGE_BUCKETS, timing["buckets"]):
+                lines.append(f'{metric}_bucket{{stage="{stage_name}",le="{bound}"}} {count}')
+            lines.append(f'{metric}_bucket{{stage="{stage_name}",le="+Inf"}} {timing["count"]}')
+            lines.append(f'{metric}_sum{{stage="{stage_name}"}} {timing["sum"]:.6f}')
+            lines.append(f'{metric}_count{{stage="{stage_name}"}} {timing["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """Returns counters and stage timings as plain dicts (handy for logs and tests)."""
+    with _lock:
+        return {
+            "counters": {name + _format_labels(labels): value for (name, labels), value in _counters.items()},
+            "stages": {k: {"count": v["count"], "sum": v["sum"]} for k, v in _stage_timings.items()},
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _stage_timings.clear()
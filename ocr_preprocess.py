@@ -0,0 +1,263 @@
+"""Image preprocessing for Tesseract OCR (NumPy + PIL only).
+
+Scanned pages come out of ``convert_from_path`` as large RGB bitmaps with noise,
+borders and a little skew, which makes Tesseract both slower and less accurate.
+``preprocess_page`` turns them into a cropped, deskewed, binarized grayscale image
+at a fixed resolution:
+
+    grayscale -> DPI normalisation -> deskew -> adaptive binarization -> border crop
+"""
+import logging
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Resolution Tesseract is tuned for; pages are rendered (or rescaled) to this.
+OCR_DPI = 300
+# Longest side (pixels) a page may have before it is scaled down regardless of DPI.
+MAX_OCR_SIDE_PX = 4200
+
+# --psm 4: a single column of text of variable sizes, which suits label/value forms.
+# tessedit_do_invert=0 skips Tesseract's second pass over inverted text.
+TESSERACT_CONFIG = "--oem 1 --psm 4 -c tessedit_do_invert=0"
+
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+_DESKEW_SAMPLE_SIDE_PX = 1000
+
+
+def to_grayscale(img):
+    """Returns a 2-D uint8 array for a PIL image or an array."""
+    if isinstance(img, Image.Image):
+        return np.asarray(img.convert("L"), dtype=np.uint8)
+    arr = np.asarray(img)
+    if arr.ndim == 3:
+        # ITU-R 601 luma, same weights PIL uses for "L"
+        arr = arr[..., :3] @ np.array([0.299, 0.587, 0.114])
+    return arr.astype(np.uint8)
+
+
+def normalize_dpi(gray, source_dpi, target_dpi=OCR_DPI, max_side=MAX_OCR_SIDE_PX):
+    """Rescales to ``target_dpi`` (and caps the longest side) so OCR cost per page is bounded."""
+    scale = target_dpi / float(source_dpi) if source_dpi else 1.0
+    longest = max(gray.shape) * scale
+    if longest > max_side:
+        scale *= max_side / longest
+    if abs(scale - 1.0) < 0.05:
+        return gray
+    height, width = gray.shape
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return np.asarray(Image.fromarray(gray).resize(size, Image.LANCZOS if scale < 1 else Image.BICUBIC))
+
+
+def adaptive_binarize(gray, window=31, offset=10):
+    """Mean-threshold binarization over a ``window`` x ``window`` neighbourhood (integral image).
+
+    A pixel becomes black (0) when it is more than ``offset`` darker than its local mean,
+    which copes with uneven lighting and shadows that defeat a single global threshold.
+    """
+    half = window // 2
+    padded = np.pad(gray.astype(np.int64), ((half + 1, half), (half + 1, half)), mode="edge")
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    height, width = gray.shape
+    sums = (
+        integral[window:window + height, window:window + width]
+        - integral[0:height, window:window + width]
+        - integral[window:window + height, 0:width]
+        + integral[0:height, 0:width]
+    )
+    local_mean = sums / float(window * window)
+    return np.where(gray.astype(np.float64) < local_mean - offset, 0, 255).astype(np.uint8)
+
+
+def estimate_skew(binary, max_angle=DESKEW_MAX_ANGLE, step=DESKEW_STEP):
+    """Estimates skew (degrees) by maximising the variance of the horizontal projection."""
+    img = Image.fromarray(255 - binary)  # Ink as white so rotation fills with "paper"
+    scale = _DESKEW_SAMPLE_SIDE_PX / float(max(img.size))
+    if scale < 1:
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.NEAREST)
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        rows = np.asarray(img.rotate(float(angle), resample=Image.NEAREST, fillcolor=0)).sum(axis=1, dtype=np.float64)
+        score = float(np.var(rows))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def deskew(gray, binary=None):
+    """Rotates ``gray`` so text lines are horizontal. Returns ``(image, angle)``."""
+    if binary is None:
+        binary = adaptive_binarize(gray)
+    angle = estimate_skew(binary)
+    if abs(angle) < DESKEW_STEP / 2:
+        return gray, 0.0
+    rotated = Image.fromarray(gray).rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    return np.asarray(rotated), angle
+
+
+def crop_borders(binary, dark_fraction=0.6, margin=10):
+    """Drops dark scanner borders and blank margins around the ink. Returns the crop box.
+
+    Rows/columns at the edges that are mostly black are treated as scanner border,
+    then the box is shrunk to the remaining ink plus ``margin`` pixels.
+    """
+    ink = binary == 0
+    height, width = ink.shape
+    row_fraction = ink.mean(axis=1)
+    col_fraction = ink.mean(axis=0)
+
+    def inner_bounds(fraction, size):
+        start, end = 0, size
+        while start < end and fraction[start] > dark_fraction:
+            start += 1
+        while end > start and fraction[end - 1] > dark_fraction:
+            end -= 1
+        return start, end
+
+    top, bottom = inner_bounds(row_fraction, height)
+    left, right = inner_bounds(col_fraction, width)
+    inner = ink[top:bottom, left:right]
+    rows = np.flatnonzero(inner.any(axis=1))
+    cols = np.flatnonzero(inner.any(axis=0))
+    if rows.size == 0 or cols.size == 0:
+        return (0, 0, width, height)
+    return (
+        max(left + cols[0] - margin, 0),
+        max(top + rows[0] - margin, 0),
+        min(left + cols[-1] + 1 + margin, width),
+        min(top + rows[-1] + 1 + margin, height),
+    )
+
+
+def preprocess_page(img, source_dpi=OCR_DPI, binarize=True):
+    """Runs the full pipeline on one rendered page and returns a PIL image for Tesseract."""
+    gray = normalize_dpi(to_grayscale(img), source_dpi)
+    binary = adaptive_binarize(gray)
+    gray, angle = deskew(gray, binary)
+    if angle:
+        binary = adaptive_binarize(gray)
+    left, top, right, bottom = crop_borders(binary)
+    out = binary if binarize else gray
+    if angle:
+        logger.debug(f"Deskewed page by {angle:.1f} degrees.")
+    return Image.fromarray(out[top:bottom, left:right])
+
+
+# --- Form-region detection (for label-only OCR) ---
+
+DETECT_DPI = 72
+MIN_LINE_FRACTION = 0.06  # Horizontal input lines are at least this share of the page width
+CHECKBOX_MIN_PX = 8
+CHECKBOX_MAX_PX = 24
+
+
+def _horizontal_runs(ink, min_len):
+    """Returns an ``(n, 3)`` array of ``(row, x_start, x_end)`` for ink runs of ``min_len``+ pixels."""
+    padded = np.pad(ink.astype(np.int8), ((0, 0), (1, 1)))
+    edges = np.diff(padded, axis=1)
+    start_rows, start_cols = np.nonzero(edges == 1)
+    _, end_cols = np.nonzero(edges == -1)  # Same row-major order, so starts and ends pair up
+    lengths = end_cols - start_cols
+    keep = lengths >= min_len
+    return np.stack([start_rows[keep], start_cols[keep], end_cols[keep]], axis=1)
+
+
+def _merge_runs(runs, gap=2):
+    """Merges runs on adjacent rows (thick or anti-aliased lines) into one segment each."""
+    merged = []
+    for row, x0, x1 in runs[np.lexsort((runs[:, 1], runs[:, 0]))] if len(runs) else []:
+        for seg in merged:
+            if row - seg[3] <= gap and x0 < seg[2] and x1 > seg[1]:
+                seg[1], seg[2], seg[3] = min(seg[1], x0), max(seg[2], x1), row
+                break
+        else:
+            merged.append([row, x0, x1, row])  # top row, x0, x1, bottom row
+    return merged
+
+
+def detect_form_regions(gray, min_line_fraction=MIN_LINE_FRACTION):
+    """Finds likely input regions on a low-resolution page render.
+
+    Returns a list of ``{"kind": "line" | "checkbox", "box": (x0, y0, x1, y1)}`` in pixels
+    of ``gray``. Lines cover underlines, underscores and the edges of input boxes;
+    checkboxes are small squares made of two short, equally wide horizontal edges.
+    """
+    ink = adaptive_binarize(gray, window=15, offset=15) == 0
+    height, width = ink.shape
+    regions = []
+
+    for top, x0, x1, bottom in _merge_runs(_horizontal_runs(ink, max(8, int(width * min_line_fraction)))):
+        if bottom - top <= 4:  # Thicker blocks are filled areas/images, not input lines
+            regions.append({"kind": "line", "box": (int(x0), int(top), int(x1), int(bottom) + 1)})
+
+    short = [seg for seg in _merge_runs(_horizontal_runs(ink, CHECKBOX_MIN_PX))
+             if CHECKBOX_MIN_PX <= seg[2] - seg[1] <= CHECKBOX_MAX_PX]
+    short.sort(key=lambda seg: (seg[1], seg[0]))
+    for i, (top, x0, x1, _) in enumerate(short):
+        size = x1 - x0
+        for other_top, ox0, ox1, other_bottom in short[i + 1:]:
+            if ox0 - x0 > 2:
+                break
+            if abs(ox1 - x1) <= 2 and abs((other_top - top) - size) <= max(2, size // 4):
+                # Both vertical sides must be inked too, otherwise it's two stacked underlines
+                sides_inked = (ink[top:other_bottom + 1, x0].mean() > 0.8
+                               and ink[top:other_bottom + 1, x1 - 1].mean() > 0.8)
+                # ... and the inside mostly empty, which rules out glyphs such as "B" or "D"
+                inside_empty = ink[top + 2:other_top - 1, x0 + 2:x1 - 2].mean() < 0.2 if size > 5 else False
+                box = (int(x0), int(top), int(x1), int(other_bottom) + 1)
+                if sides_inked and inside_empty and not any(
+                        r["kind"] == "checkbox" and abs(r["box"][0] - box[0]) <= 2 and abs(r["box"][1] - box[1]) <= 3
+                        for r in regions):
+                    regions.append({"kind": "checkbox", "box": box})
+                break
+    return regions
+
+
+def label_crop_candidates(region, page_width, line_height=14, label_width_fraction=0.35):
+    """Returns candidate label boxes for an input region: to its left first, then above it.
+
+    All values are in detection pixels; ``line_height`` is one text line at DETECT_DPI.
+    """
+    x0, y0, x1, y1 = region["box"]
+    if region["kind"] == "checkbox":
+        # Checkbox labels usually follow the box on the same line
+        return [
+            (x1 + 1, y0 - 3, min(page_width, x1 + int(page_width * label_width_fraction)), y1 + 3),
+            (max(0, x0 - int(page_width * label_width_fraction)), y0 - 3, x0 - 1, y1 + 3),
+        ]
+    return [
+        (max(0, x0 - int(page_width * label_width_fraction)), y1 - line_height - 2, x0 - 1, y1 + 2),
+        (x0, max(0, y0 - 2 * line_height), x1, y0 - 1),
+    ]
+
+
+def has_ink(gray, box, min_fraction=0.01):
+    """True when ``box`` (pixels of ``gray``) contains some ink, i.e. is worth OCR-ing."""
+    x0, y0, x1, y1 = (int(v) for v in box)
+    crop = gray[max(0, y0):max(0, y1), max(0, x0):max(0, x1)]
+    return crop.size > 0 and float((crop < 128).mean()) >= min_fraction
+
+
+# White rows between stacked label crops, so Tesseract never joins two crops into one line.
+LABEL_STRIP_GAP_PX = 24
+
+
+def stack_crops(crops, gap=LABEL_STRIP_GAP_PX):
+    """Stacks 2-D uint8 crops top to bottom, left-aligned on white, for a single OCR call.
+
+    Returns ``(strip, spans)`` where ``spans[i]`` is the ``(y0, y1)`` row range of crop ``i``.
+    """
+    width = max(crop.shape[1] for crop in crops)
+    height = sum(crop.shape[0] for crop in crops) + gap * (len(crops) + 1)
+    strip = np.full((height, width), 255, dtype=np.uint8)
+    spans = []
+    y = gap
+    for crop in crops:
+        strip[y:y + crop.shape[0], :crop.shape[1]] = crop
+        spans.append((y, y + crop.shape[0]))
+        y += crop.shape[0] + gap
+    return strip, spans
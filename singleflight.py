@@ -0,0 +1,92 @@
+"""Single-flight request coalescing.
+
+When several threads (Streamlit sessions, load-test workers) ask for the same expensive
+result at the same moment, only the first one computes it; the others wait for that
+in-flight call and get a copy of its result (or its exception):
+
+    text_elements = Group("text_elements")
+    elements = text_elements.do(key, partition, pdf_path)
+
+Nothing is cached: once the call finishes, the next request for the key runs again.
+Coalescing is per process; separate batch processes each compute their own result.
+"""
+import copy
+import hashlib
+import json
+import logging
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class Group:
+    """A namespace of in-flight calls, keyed by any hashable value."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Runs ``fn(*args, **kwargs)`` unless a call for ``key`` is already in flight.
+
+        Every caller gets its own deep copy of the result, so callers may mutate it freely.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            metrics.inc("singleflight_shared_total", group=self.name)
+            with metrics.stage(f"singleflight_wait_{self.name}"):
+                call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                logger.info(f"Single-flight '{self.name}': {call.waiters} concurrent caller(s) shared one result.")
+        return copy.deepcopy(call.result) if call.waiters else call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+def hash_key(*parts):
+    """Stable SHA-256 key for JSON-serialisable parts (labels, profile keys, hints ...)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Content hash of a file, so the same document uploaded twice shares one key."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import batch
+
+
+def _claim_path(work_dir, shard=0):
+    return batch._shard_paths(str(work_dir), shard)["claim"]
+
+
+def _age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_claim_is_exclusive(tmp_path):
+    token = batch.try_claim_shard(str(tmp_path), 0)
+    assert token
+    assert batch.owns_claim(_claim_path(tmp_path), token)
+    assert batch.try_claim_shard(str(tmp_path), 0) is None
+    assert batch.try_claim_shard(str(tmp_path), 1)  # Other shards are independent
+
+
+def test_fresh_claim_is_not_taken_over(tmp_path):
+    token = batch.try_claim_shard(str(tmp_path), 0, stale_after_s=60)
+    _age(_claim_path(tmp_path), 30)
+    assert batch.try_claim_shard(str(tmp_path), 0, stale_after_s=60) is None
+    assert batch.owns_claim(_claim_path(tmp_path), token)
+
+
+def test_stale_claim_is_taken_over_once(tmp_path):
+    old = batch.try_claim_shard(str(tmp_path), 0, stale_after_s=60)
+    _age(_claim_path(tmp_path), 120)
+
+    barrier = threading.Barrier(8)
+    tokens = []
+
+    def contend():
+        barrier.wait()
+        tokens.append(batch.try_claim_shard(str(tmp_path), 0, stale_after_s=60))
+
+    threads = [threading.Thread(target=contend) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    winners = [t for t in tokens if t]
+    assert len(winners) == 1
+    assert winners[0] != old
+    assert not batch.owns_claim(_claim_path(tmp_path), old)
+    assert batch.owns_claim(_claim_path(tmp_path), winners[0])
+    assert [p for p in os.listdir(tmp_path) if ".stale-" in p] == []
+
+
+def test_completed_shard_is_not_claimed(tmp_path):
+    open(batch._shard_paths(str(tmp_path), 0)["complete"], "w").close()
+    assert batch.try_claim_shard(str(tmp_path), 0) is None
+
+
+def test_heartbeat_keeps_claim_fresh_and_notices_takeover(tmp_path):
+    claim = _claim_path(tmp_path)
+    token = batch.try_claim_shard(str(tmp_path), 0)
+    _age(claim, 120)
+    heartbeat = batch._Heartbeat(claim, token, interval_s=0.05)
+    heartbeat.start()
+    try:
+        time.sleep(0.2)
+        assert time.time() - os.stat(claim).st_mtime < 5
+        with open(claim, "w") as f:
+            f.write("someone-else")
+        assert heartbeat.lost.wait(2)
+    finally:
+        heartbeat.stop()
+
+
+def test_torn_checkpoint_line_is_skipped_and_repaired(tmp_path):
+    checkpoint = tmp_path / "shard.done.jsonl"
+    checkpoint.write_text('{"id": "0:a.pdf", "status": "ok"}\n'
+                          '{"id": "1:b.pdf", "status": "error"}\n'
+                          '{"id": "2:c.pdf", "sta', encoding="utf-8")
+    assert batch.load_checkpoint(str(checkpoint)) == {"0:a.pdf"}
+
+    batch._repair_checkpoint(str(checkpoint))
+    with open(checkpoint, "a", encoding="utf-8") as f:
+        batch._append_checkpoint(f, {"id": "2:c.pdf", "status": "skipped"})
+    assert batch.load_checkpoint(str(checkpoint)) == {"0:a.pdf", "2:c.pdf"}
+    assert all(json.loads(line) for line in checkpoint.read_text(encoding="utf-8").splitlines())
+
+
+def test_missing_checkpoint(tmp_path):
+    assert batch.load_checkpoint(str(tmp_path / "none.jsonl")) == set()
+    batch._repair_checkpoint(str(tmp_path / "none.jsonl"))
+
+
+@pytest.fixture
+def processed(monkeypatch):
+    processed = []
+
+    def fake_process_item(line_no, item, out_dir, form_type_hint=""):
+        processed.append(item["id"])
+        return {"status": "ok", "output": f"{out_dir}/{line_no}.pdf"}
+
+    monkeypatch.setattr(batch, "process_item", fake_process_item)
+    return processed
+
+
+def test_resumed_shard_skips_completed_items(tmp_path, processed):
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text("a.pdf\nb.pdf\n# comment\nc.pdf\nd.pdf\n", encoding="utf-8")
+    paths = batch._shard_paths(str(tmp_path), 0)
+    with open(paths["checkpoint"], "w", encoding="utf-8") as f:
+        f.write('{"id": "0:a.pdf", "status": "ok"}\n'
+                '{"id": "1:b.pdf", "status": "error"}\n'
+                '{"id": "3:c.pdf", "status": "skipped"}\n'
+                '{"id": "4:d.pd')
+
+    summary = batch.run_shard(str(manifest), str(tmp_path), str(tmp_path / "out"), 1, 0)
+    assert processed == ["1:b.pdf", "4:d.pdf"]  # Failed and torn items are redone
+    assert summary["claimed"] and summary["resumed"] == 2 and summary["ok"] == 2
+    assert batch.load_checkpoint(paths["checkpoint"]) == {"0:a.pdf", "1:b.pdf", "3:c.pdf", "4:d.pdf"}
+    assert os.path.exists(paths["complete"])
+    assert not os.path.exists(paths["claim"])
+
+
+def test_claimed_shard_is_left_alone(tmp_path, processed):
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text("a.pdf\n", encoding="utf-8")
+    assert batch.try_claim_shard(str(tmp_path), 0)
+    summary = batch.run_shard(str(manifest), str(tmp_path), str(tmp_path / "out"), 1, 0)
+    assert not summary["claimed"]
+    assert processed == []
@@ -0,0 +1,86 @@
+import fitz  # PyMuPDF
+import pytest
+
+from form_fields import PdfName, extract_acroform_fields, parse_pdf_object
+
+
+def test_name_escapes_are_decoded():
+    obj = parse_pdf_object("<</V /Yes#20Please /AS /caf#C3#A9 /A#2fB 1>>")
+    assert obj["V"] == "Yes Please"
+    assert isinstance(obj["V"], PdfName)
+    assert obj["AS"] == "café"
+    assert obj["A/B"] == 1
+
+
+def test_strings():
+    obj = parse_pdf_object(r"<</A <FEFF00E90020004A> /B <48 69 2> /C (a\(b\) \101\nc) /D (\376\377\000X)>>")
+    assert obj["A"] == "é J"
+    assert obj["B"] == "Hi "
+    assert obj["C"] == "a(b) A\nc"
+    assert obj["D"] == "X"
+
+
+def test_arrays_refs_and_numbers():
+    obj = parse_pdf_object("[1 0 R 2.5 -3 true null /N [(x)]]")
+    assert obj == [("ref", 1), 2.5, -3, True, None, "N", ["x"]]
+
+
+def _add_object(doc, source):
+    xref = doc.get_new_xref()
+    doc.update_object(xref, source)
+    return xref
+
+
+@pytest.fixture
+def field_tree_pdf(tmp_path):
+    """A hand-built field tree: inherited FT/Ff/V, nested Kids, widget-only Kids, escaped names."""
+    doc = fitz.open()
+    page = doc.new_page(width=600, height=800)
+    page_xref = page.xref
+    xrefs = [doc.get_new_xref() for _ in range(7)]
+    person, name, city, agree, choice, choice_a, choice_b = xrefs
+    doc.update_object(person, f"<</T (person) /FT /Tx /V (inherited) /Kids [{name} 0 R {city} 0 R]>>")
+    doc.update_object(name, f"<</Type /Annot /Subtype /Widget /Parent {person} 0 R /T (name) "
+                            f"/Rect [100 700 300 720] /P {page_xref} 0 R>>")
+    doc.update_object(city, f"<</Type /Annot /Subtype /Widget /Parent {person} 0 R /T <FEFF00E9007400E9> "
+                            f"/V (Paris) /Rect [100 650 300 670] /P {page_xref} 0 R>>")
+    doc.update_object(agree, f"<</Type /Annot /Subtype /Widget /T (agree) /FT /Btn /V /Yes#20Please "
+                             f"/Rect [100 600 115 615] /P {page_xref} 0 R>>")
+    doc.update_object(choice, f"<</T (choice) /FT /Btn /Ff 32768 /V /B /Kids [{choice_a} 0 R {choice_b} 0 R]>>")
+    for xref, y in ((choice_a, 550), (choice_b, 520)):
+        doc.update_object(xref, f"<</Type /Annot /Subtype /Widget /Parent {choice} 0 R "
+                                f"/Rect [100 {y} 115 {y + 15}] /P {page_xref} 0 R>>")
+    acroform = _add_object(doc, f"<</Fields [{person} 0 R {agree} 0 R {choice} 0 R]>>")
+    doc.xref_set_key(doc.pdf_catalog(), "AcroForm", f"{acroform} 0 R")
+    doc.xref_set_key(page_xref, "Annots", f"[{name} 0 R {city} 0 R {agree} 0 R {choice_a} 0 R {choice_b} 0 R]")
+    path = tmp_path / "tree.pdf"
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def test_field_tree(field_tree_pdf):
+    fields = extract_acroform_fields(field_tree_pdf)
+    assert set(fields) == {"person.name", "person.été", "agree", "choice"}
+
+    name = fields["person.name"]
+    assert name.type == fitz.PDF_WIDGET_TYPE_TEXT  # FT inherited from the parent
+    assert name.value == "inherited"
+    assert name.page == 0
+    assert tuple(name.rect) == (100, 80, 300, 100)  # Flipped to top-left origin
+    assert fields["person.été"].value == "Paris"
+
+    assert fields["agree"].type == fitz.PDF_WIDGET_TYPE_CHECKBOX
+    assert fields["agree"].value == "Yes Please"
+
+    choice = fields["choice"]
+    assert choice.type == fitz.PDF_WIDGET_TYPE_RADIOBUTTON  # Ff radio flag on the parent
+    assert choice.value == "B"
+    assert tuple(choice.rect) == (100, 235, 115, 250)  # First widget kid
+
+
+def test_no_acroform(tmp_path):
+    doc = fitz.open()
+    doc.new_page()
+    with pytest.raises(ValueError):
+        extract_acroform_fields(doc)
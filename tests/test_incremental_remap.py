@@ -0,0 +1,89 @@
+import pytest
+
+utils = pytest.importorskip("utils")
+
+KEYS = ["firstName", "lastName", "dob", "address"]
+LABELS = ["First Name", "Last Name", "Date of birth", "City", "Social Security Number", "Signature"]
+MAPPINGS = {
+    "First Name": "firstName",
+    "Last Name": "lastName",
+    "Date of birth": "dob",
+    "City": "address.city",
+    "Social Security Number": "NOMATCH",
+    "Signature": "NOMATCH",
+}
+
+
+def plan(keys, labels=LABELS, previous_texts=LABELS):
+    return utils.plan_incremental_remap(MAPPINGS, KEYS, labels, keys, previous_texts=previous_texts)
+
+
+def test_unchanged_keys_requery_nothing():
+    assert plan(KEYS) == {"added": [], "removed": [], "labels": []}
+
+
+def test_added_key_requeries_every_nomatch_label():
+    result = plan(KEYS + ["ssn"])
+    assert result["added"] == ["ssn"]
+    assert result["labels"] == ["Social Security Number", "Signature"]
+
+
+def test_added_key_requeries_mapped_labels_sharing_a_new_word():
+    assert "Date of birth" in plan(KEYS + ["birthPlace"])["labels"]
+    # "name" already occurs in kept keys, so middleName does not disturb First/Last Name
+    assert plan(KEYS + ["middleName"])["labels"] == ["Social Security Number", "Signature"]
+
+
+def test_removed_key_requeries_its_labels():
+    result = plan(["firstName", "lastName", "dob"])
+    assert result["removed"] == ["address"]
+    assert result["labels"] == ["City"]  # Nested paths under a removed key are stale too
+
+
+def test_renamed_key_counts_as_removed_and_added():
+    result = plan(["firstName", "surname", "dob", "address"])
+    assert result["added"] == ["surname"]
+    assert result["removed"] == ["lastName"]
+    assert result["labels"] == ["Last Name", "Social Security Number", "Signature"]
+
+
+def test_new_labels_are_queried_but_truncated_ones_are_not():
+    labels = LABELS + ["Phone", "Fax"]
+    result = plan(KEYS, labels=labels, previous_texts=LABELS + ["Fax"])
+    assert result["labels"] == ["Phone"]
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def fake_get_llm_mappings(texts, keys, form_type_hint="", backend=None):
+        calls.append(list(texts))
+        return {text: "NOMATCH" for text in texts}
+
+    monkeypatch.setattr(utils, "get_llm_mappings", fake_get_llm_mappings)
+    return calls
+
+
+def test_incremental_remap_only_sends_planned_labels(calls):
+    mappings = utils.get_llm_mappings_incremental(LABELS, ["firstName", "dob", "address"], MAPPINGS, KEYS,
+                                                  previous_texts=LABELS)
+    assert calls == [["Last Name"]]
+    assert mappings["Last Name"] == "NOMATCH"
+    assert mappings["First Name"] == "firstName"
+
+
+def test_full_remap_when_too_many_labels_change(calls, monkeypatch):
+    # Adding a key re-queries the two NOMATCH labels: 2/6 labels
+    utils.get_llm_mappings_incremental(LABELS, KEYS + ["ssn"], MAPPINGS, KEYS, previous_texts=LABELS)
+    assert calls == [["Social Security Number", "Signature"]]
+
+    calls.clear()
+    monkeypatch.setattr(utils, "INCREMENTAL_FULL_REMAP_FRACTION", 0.3)
+    utils.get_llm_mappings_incremental(LABELS, KEYS + ["ssn"], MAPPINGS, KEYS, previous_texts=LABELS)
+    assert calls == [LABELS]
+
+
+def test_unchanged_keys_reuse_previous_mappings(calls):
+    assert utils.get_llm_mappings_incremental(LABELS, KEYS, MAPPINGS, KEYS, previous_texts=LABELS) == MAPPINGS
+    assert calls == []
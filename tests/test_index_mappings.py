@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+utils = pytest.importorskip("utils")
+
+LABELS = ["First Name", "Last Name", "Email"]
+KEYS = ["firstName", "lastName", "email", "phone"]
+
+
+def decode(reply):
+    return utils.decode_index_mappings(reply if isinstance(reply, str) else json.dumps(reply), LABELS, KEYS)
+
+
+def test_index_pairs():
+    assert decode({"0": [0], "1": 1, "2": [2, 3]}) == {
+        "First Name": "firstName", "Last Name": "lastName", "Email": "email, phone",
+    }
+
+
+def test_unanswered_labels_are_nomatch():
+    assert decode({"1": [1]}) == {"First Name": "NOMATCH", "Last Name": "lastName", "Email": "NOMATCH"}
+    assert decode({}) == dict.fromkeys(LABELS, "NOMATCH")
+
+
+@pytest.mark.parametrize("label_idx", ["-1", "1.9", "3", "01x", "", " ", "²"])
+def test_invalid_label_indices_are_ignored(label_idx):
+    assert decode({label_idx: [0]}) == dict.fromkeys(LABELS, "NOMATCH")
+
+
+@pytest.mark.parametrize("key_idx", [-1, 1.9, 1.0, True, False, 4, "x", None, [0]])
+def test_invalid_key_indices_are_ignored(key_idx):
+    assert decode({"0": [key_idx]})["First Name"] == "NOMATCH"
+    assert decode({"0": [key_idx, 1]})["First Name"] == "lastName"
+
+
+def test_digit_string_key_indices():
+    assert decode({"0": ["2"], " 1 ": " 0 "}) == {"First Name": "email", "Last Name": "firstName", "Email": "NOMATCH"}
+
+
+@pytest.mark.parametrize("reply", [
+    '```json\n{"0": [0]}\n```',
+    '```\n{"0": [0]}\n```',
+    '  {"0": [0]}  ',
+])
+def test_code_fenced_replies(reply):
+    assert decode(reply)["First Name"] == "firstName"
+
+
+@pytest.mark.parametrize("reply", ['[[0, 0]]', '"0"', 'not json', '```json\n[0]\n```'])
+def test_non_object_replies_raise(reply):
+    with pytest.raises(ValueError):
+        decode(reply)
+
+
+def test_prompt_indices_round_trip():
+    prompt, labels, keys = utils.build_mapping_prompt(["First  Name", "First Name", "Email"], KEYS + ["email"])
+    assert labels == ["First Name", "Email"]
+    assert keys == KEYS
+    assert "K:\n0 firstName\n" in prompt
+    assert prompt.endswith("L:\n0 First Name\n1 Email")
@@ -0,0 +1,90 @@
+import datetime
+
+import pytest
+
+from mapping_plan import compile_mapping_plan, compile_transform, profile_keys
+
+PROFILE = {
+    "firstName": "Ada",
+    "lastName": "Lovelace",
+    "dob": "1815-12-10",
+    "phone": "+44 (20) 7946-0000",
+    "address": {"city": "London", "zip": "W1"},
+    "phones": ["555-0100", "555-0199"],
+    "codes": {"1": "x", "2": "y"},
+    "tags": [],
+}
+
+
+def test_profile_keys_flattens_nested_values():
+    assert profile_keys(PROFILE) == [
+        "firstName", "lastName", "dob", "phone", "address.city", "address.zip",
+        "phones.0", "phones.1", "codes.1", "codes.2", "tags",
+    ]
+
+
+def test_every_offered_key_resolves():
+    plan = compile_mapping_plan({key: key for key in profile_keys(PROFILE)})
+    assert plan.missing_keys(PROFILE) == []
+    data = plan.apply(PROFILE)
+    assert data["address.city"] == "London"
+    assert data["phones.1"] == "555-0199"
+    assert data["codes.1"] == "x"  # Numeric segment, but a dict key
+
+
+def test_nested_paths_and_literal_dotted_keys():
+    plan = compile_mapping_plan({"City": "address.city", "Phone 2": "phones.1", "Bad": "phones.-1", "Literal": "a.b"})
+    assert plan.apply({"address": {"city": "Paris"}, "phones": ["1", "2"], "a.b": "dotted", "a": {"b": "nested"}}) == {
+        "City": "Paris", "Phone 2": "2", "Bad": "", "Literal": "dotted",
+    }
+
+
+def test_combined_keys_nomatch_and_missing():
+    plan = compile_mapping_plan({
+        "Full Name": "firstName, lastName",
+        "Middle": "middleName",
+        "Unmapped": "NOMATCH",
+        "Empty": "",
+    })
+    assert len(plan) == 2
+    assert plan.apply(PROFILE) == {"Full Name": "Ada Lovelace", "Middle": ""}
+    assert plan.apply(PROFILE, fields={"Full Name"}) == {"Full Name": "Ada Lovelace"}
+    assert plan.missing_keys(PROFILE) == [("Middle", "middleName")]
+    assert list(plan.rows(PROFILE)) == [
+        ("Full Name", "firstName, lastName", "Ada Lovelace"),
+        ("Middle", "middleName", "KEY_NOT_FOUND"),
+    ]
+
+
+def test_inline_and_per_field_transforms():
+    plan = compile_mapping_plan(
+        {"DOB": "dob | date:%d/%m/%Y", "Phone": "phone", "City": "address.city | upper"},
+        transforms={"Phone": "phone:digits", "City": "lower"},
+    )
+    assert plan.apply(PROFILE) == {"DOB": "10/12/1815", "Phone": "442079460000", "City": "london"}
+
+
+def test_unknown_transform_is_ignored():
+    plan = compile_mapping_plan({"City": "address.city | shout"}, transforms={"DOB": 3})
+    assert plan.apply(PROFILE) == {"City": "London"}
+
+
+@pytest.mark.parametrize("spec, value, expected", [
+    ("date:%m/%d/%Y", "10.12.1815", "12/10/1815"),
+    ("date", datetime.date(1815, 12, 10), "1815-12-10"),
+    ("date:%Y", "not a date", "not a date"),
+    ("phone", "+1 (555) 010-0", "+15550100"),
+    ("phone", "555 0100", "5550100"),
+    ("title", "ada lovelace", "Ada Lovelace"),
+    ("strip", "  x ", "x"),
+])
+def test_transforms(spec, value, expected):
+    assert compile_transform(spec)(value) == expected
+
+
+def test_bad_transform_specs():
+    assert compile_transform("") is None
+    with pytest.raises(ValueError):
+        compile_transform("nope")
+    with pytest.raises(ValueError):
+        compile_transform(["upper"])
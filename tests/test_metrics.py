@@ -0,0 +1,31 @@
+import pytest
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_label_values_are_escaped():
+    metrics.inc("pdfs_total", pdf='say "hi"\\now\n.pdf')
+    lines = metrics.prometheus_text().splitlines()
+    assert lines == [
+        "# TYPE form_filler_pdfs_total counter",
+        'form_filler_pdfs_total{pdf="say \\"hi\\"\\\\now\\n.pdf"} 1',
+    ]
+
+
+def test_counters_and_stage_histogram():
+    metrics.inc("pages_total", 3, stage="ocr")
+    metrics.inc("pages_total", 2, stage="ocr")
+    with metrics.stage("fill"):
+        pass
+    text = metrics.prometheus_text()
+    assert 'form_filler_pages_total{stage="ocr"} 5' in text
+    assert 'form_filler_stage_duration_seconds_bucket{stage="fill",le="+Inf"} 1' in text
+    assert 'form_filler_stage_duration_seconds_count{stage="fill"} 1' in text
+    assert metrics.snapshot()["counters"] == {'pages_total{stage="ocr"}': 5}
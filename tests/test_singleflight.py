@@ -0,0 +1,94 @@
+import threading
+import time
+
+import metrics
+import singleflight
+
+
+def _run_concurrently(n, fn):
+    """Calls ``fn()`` from ``n`` threads at once; returns results/exceptions in thread order."""
+    barrier = threading.Barrier(n)
+    outcomes = [None] * n
+
+    def worker(i):
+        barrier.wait()
+        try:
+            outcomes[i] = fn()
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return outcomes
+
+
+def test_concurrent_callers_share_one_call():
+    metrics.reset()
+    group = singleflight.Group("shared")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)  # Long enough for every caller to join the in-flight call
+        return {"labels": ["a", "b"]}
+
+    results = _run_concurrently(8, lambda: group.do("key", compute))
+    assert len(calls) == 1
+    assert results == [{"labels": ["a", "b"]}] * 8
+    assert group.in_flight() == 0
+    assert metrics.snapshot()["counters"]['singleflight_shared_total{group="shared"}'] == 7
+
+
+def test_callers_get_independent_copies():
+    group = singleflight.Group("test")
+
+    def compute():
+        time.sleep(0.2)
+        return {"labels": ["a"]}
+
+    results = _run_concurrently(4, lambda: group.do("key", compute))
+    results[0]["labels"].append("mutated")
+    assert [r["labels"] for r in results[1:]] == [["a"]] * 3
+    assert len({id(r) for r in results}) == 4
+
+
+def test_different_keys_run_separately():
+    group = singleflight.Group("test")
+    calls = []
+    assert group.do("a", lambda: calls.append("a") or 1) == 1
+    assert group.do("b", lambda: calls.append("b") or 2) == 2
+    assert calls == ["a", "b"]
+
+
+def test_waiters_see_the_leaders_exception_and_the_key_can_be_retried():
+    group = singleflight.Group("test")
+    calls = []
+
+    def fail():
+        calls.append(1)
+        time.sleep(0.2)
+        raise RuntimeError("backend down")
+
+    outcomes = _run_concurrently(5, lambda: group.do("key", fail))
+    assert len(calls) == 1
+    assert all(isinstance(o, RuntimeError) and str(o) == "backend down" for o in outcomes)
+
+    assert group.do("key", lambda: "recovered") == "recovered"
+    assert group.in_flight() == 0
+
+
+def test_hash_key_is_stable():
+    assert singleflight.hash_key(["a"], {"x": 1, "y": 2}) == singleflight.hash_key(["a"], {"y": 2, "x": 1})
+    assert singleflight.hash_key(["a"], "hint") != singleflight.hash_key(["a"], "other")
+
+
+def test_file_sha256(tmp_path):
+    one, two = tmp_path / "one.pdf", tmp_path / "two.pdf"
+    one.write_bytes(b"%PDF-1.7 same")
+    two.write_bytes(b"%PDF-1.7 same")
+    assert singleflight.file_sha256(one) == singleflight.file_sha256(two)
+    two.write_bytes(b"%PDF-1.7 different")
+    assert singleflight.file_sha256(one) != singleflight.file_sha256(two)